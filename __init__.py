@@ -1,5 +1,3 @@
-from . import search_window, settings_dialog, quick_actions
+from . import bootstrap
 
-search_window.init()
-settings_dialog.init()
-quick_actions.init()
+bootstrap.init()
@@ -0,0 +1,240 @@
+# Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
+
+import functools
+import re
+import time
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import NamedTuple
+
+from aqt import mw
+from aqt.operations import QueryOp
+from aqt.qt import *
+from aqt.utils import disable_help_button, restoreGeom, saveGeom, tooltip
+
+from .common import ADDON_NAME, LogDebug, sanitize_term
+from .config import config
+from .id_index import id_index
+from .note_importer import import_notes, is_in_collection, ImportResult
+from .widgets import SpinBox
+from . import note_getter
+
+logDebug = LogDebug()
+
+COLUMN_SEPARATORS = re.compile(r'[\t,;]')
+
+
+def parse_terms(text: str) -> list[str]:
+    """Reads one term per line. Of csv or tsv lines, e.g. exported from anki, the first column is the term."""
+    terms = (sanitize_term(COLUMN_SEPARATORS.split(line, 1)[0]) for line in text.splitlines())
+    return list(dict.fromkeys(term for term in terms if term))
+
+
+def best_notes(notes: Sequence[dict], count: int, model_id: int) -> list[dict]:
+    """
+    Returns the first count notes that weren't imported before, in the order of the search's sorting.
+    Notes the collection already has a duplicate of for the note type are passed over as well.
+    """
+    best = []
+    for note in notes:
+        if len(best) == count:
+            break
+        if id_index.nid_for(note['ID']) is None and not is_in_collection(model_id, note):
+            best.append(note)
+    return best
+
+
+class BatchResult(NamedTuple):
+    failed_terms: list[str]
+    imported: list[tuple[dict, ImportResult]]
+    elapsed: float
+    import_elapsed: float
+
+
+class BatchSearchDialog(QDialog):
+    """Searches a list of terms at once and shows the results grouped by term."""
+    name = 'subsearch_batch_dialog'
+
+    def __init__(self, parent: QWidget, *, model_id: int, deck_id: int, filters: list):
+        super().__init__(parent)
+        self._model_id = model_id
+        self._deck_id = deck_id
+        self._filters = filters
+        self._notes: list[dict] = []
+        self._items: dict[int, QTreeWidgetItem] = {}
+        self._term_items: dict[str, QTreeWidgetItem] = {}
+        self.terms_edit = QPlainTextEdit()
+        self.open_file_button = QPushButton('Open File...')
+        self.import_check = QCheckBox('Import the best')
+        self.import_count = SpinBox(1, 50, 1, config['batch_import_per_term'])
+        self.search_button = QPushButton('Search All')
+        self.results = QTreeWidget()
+        self.status_label = QLabel()
+        self.import_button = QPushButton('Import Selected')
+        disable_help_button(self)
+        self._setup_ui()
+        self.connect_elements()
+        restoreGeom(self, self.name, adjustSize=True)
+
+    def _setup_ui(self):
+        self.setWindowTitle(f'{ADDON_NAME} Batch Search')
+        self.setMinimumSize(500, 500)
+        self.terms_edit.setPlaceholderText('One term per line')
+        self.results.setHeaderHidden(True)
+        self.results.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+
+        self.setLayout(layout := QVBoxLayout())
+        layout.addWidget(self.terms_edit, 1)
+        layout.addLayout(options_row := QHBoxLayout())
+        options_row.addWidget(self.open_file_button)
+        options_row.addStretch()
+        options_row.addWidget(self.import_check)
+        options_row.addWidget(self.import_count)
+        options_row.addWidget(QLabel('sentences per term'))
+        options_row.addWidget(self.search_button)
+        layout.addWidget(self.results, 2)
+        layout.addLayout(import_row := QHBoxLayout())
+        import_row.addWidget(self.status_label, 1)
+        import_row.addWidget(self.import_button)
+
+    def connect_elements(self):
+        qconnect(self.open_file_button.clicked, self.open_file)
+        qconnect(self.search_button.clicked, self.start_search)
+        qconnect(self.import_button.clicked, self.import_selected)
+
+    def open_file(self):
+        file_name, _ = QFileDialog.getOpenFileName(self, 'Open Word List', filter='Word lists (*.txt *.csv *.tsv);;All files (*)')
+        if not file_name:
+            return
+        with open(file_name, encoding='utf-8-sig', errors='replace') as f:
+            self.terms_edit.setPlainText(f.read())
+
+    def start_search(self):
+        if not (terms := parse_terms(self.terms_edit.toPlainText())):
+            return tooltip('No terms entered.', parent=self)
+        import_count = self.import_count.value() if self.import_check.isChecked() else 0
+
+        self.results.clear()
+        self._notes = []
+        self._items = {}
+        self._term_items = {}
+        for term in terms:
+            # one group per term in the order of the list, filled in as the searches finish
+            self._term_items[term] = item = QTreeWidgetItem(self.results, [f'{term} (waiting)'])
+            item.setFlags(item.flags() & ~Qt.ItemFlag.ItemIsSelectable)
+        self.search_button.setEnabled(False)
+        self.status_label.setText(f'Searching {len(terms)} terms...')
+
+        QueryOp(
+            parent=self,
+            op=lambda col: self._run(terms, import_count),
+            success=self._on_finished,
+        ).failure(self._on_failed).with_progress(f'Searching {len(terms)} terms...').run_in_background()
+
+    def _run(self, terms: list[str], import_count: int) -> BatchResult:
+        start = time.perf_counter()
+        workers = max(1, config['batch_search_workers'])
+        failed_terms = []
+        to_import = []
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='subsearch_batch') as executor:
+            futures = {
+                executor.submit(note_getter.fetch_notes, note_getter.SEARCH_URL, term, extended_filters=self._filters): term
+                for term in terms
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                term, notes = futures[future], future.result()
+                if isinstance(notes, Exception):
+                    failed_terms.append(term)
+                elif import_count:
+                    to_import.extend(best_notes(notes, import_count, self._model_id))
+                mw.taskman.run_on_main(functools.partial(self._add_group, term, notes))
+                self._report_progress(f'Searched {done}/{len(terms)} terms', done, len(terms), start)
+        logDebug(f'Batch searched {len(terms)} terms with {workers} workers in {time.perf_counter() - start:.1f} s')
+
+        imported = []
+        import_elapsed = 0.0
+        if to_import:
+            mw.taskman.run_on_main(lambda: mw.progress.update(label=f'Importing {len(to_import)} notes...'))
+            import_start = time.perf_counter()
+            results = import_notes(model_id=self._model_id, notes=to_import, deck_id=self._deck_id)
+            imported = list(zip(to_import, results))
+            import_elapsed = time.perf_counter() - import_start
+            logDebug(f'Batch imported {len(to_import)} notes in {import_elapsed:.1f} s')
+        return BatchResult(failed_terms, imported, time.perf_counter() - start, import_elapsed)
+
+    @staticmethod
+    def _report_progress(label: str, done: int, total: int, start: float):
+        rate = done / max(time.perf_counter() - start, 1e-3)
+        mw.taskman.run_on_main(
+            lambda: mw.progress.update(label=f'{label} ({rate:.1f}/s)', value=done, max=total)
+        )
+
+    def _add_group(self, term: str, notes: Sequence[dict] or Exception):
+        group = self._term_items[term]
+        if isinstance(notes, Exception):
+            group.setText(0, f'{term} (failed: {notes})')
+            group.setForeground(0, QColor('red'))
+            return
+        group.setText(0, f'{term} ({len(notes)} found)')
+        for note in notes[:config['notes_per_page']]:
+            item = QTreeWidgetItem(group, [note['Expression']])
+            # the row index only, qt would convert a note into a QVariantMap
+            item.setData(0, Qt.ItemDataRole.UserRole, len(self._notes))
+            if id_index.nid_for(note['ID']) is not None:
+                item.setForeground(0, QColor('gray'))
+            self._items[id(note)] = item
+            self._notes.append(note)
+
+    def _on_finished(self, result: BatchResult):
+        self.search_button.setEnabled(True)
+        self._mark_imported(result.imported)
+        successes = sum(outcome == ImportResult.success for _, outcome in result.imported)
+        status = f'Searched {len(self._term_items)} terms in {result.elapsed:.1f} s.'
+        if result.imported:
+            rate = len(result.imported) / max(result.import_elapsed, 1e-3)
+            status += f' Imported {successes} of {len(result.imported)} notes ({rate:.1f}/s).'
+        if result.failed_terms:
+            status += f' {len(result.failed_terms)} searches failed.'
+        self.status_label.setText(status)
+        if result.imported:
+            mw.reset()
+
+    def _on_failed(self, err: Exception):
+        self.search_button.setEnabled(True)
+        self.status_label.setText(f'Batch search failed: {err}')
+        logDebug(f'Batch search failed: {err}')
+
+    def _mark_imported(self, imported: list[tuple[dict, ImportResult]]):
+        for note, outcome in imported:
+            if outcome == ImportResult.success and (item := self._items.get(id(note))) is not None:
+                item.setForeground(0, QColor('gray'))
+
+    def selected_notes(self) -> list[dict]:
+        return [
+            self._notes[item.data(0, Qt.ItemDataRole.UserRole)]
+            for item in self.results.selectedItems()
+            if item.data(0, Qt.ItemDataRole.UserRole) is not None
+        ]
+
+    def import_selected(self):
+        if not (notes := self.selected_notes()):
+            return self.status_label.setText('No notes selected.')
+
+        def on_imported(results: list[ImportResult]):
+            self._mark_imported(list(zip(notes, results)))
+            self.status_label.setText(
+                f'Imported {results.count(ImportResult.success)}, '
+                f'{results.count(ImportResult.dupe)} duplicates, {results.count(ImportResult.fail)} failed.'
+            )
+            mw.reset()
+
+        QueryOp(
+            parent=self,
+            op=lambda col: import_notes(model_id=self._model_id, notes=notes, deck_id=self._deck_id),
+            success=on_imported,
+        ).with_progress('Importing...').run_in_background()
+
+    def done(self, result: int) -> None:
+        saveGeom(self, self.name)
+        return super().done(result)
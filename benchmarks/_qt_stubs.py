@@ -0,0 +1,56 @@
+# Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
+
+"""
+Imported first by the benchmarks of Qt code. Stands in for aqt with the real Qt classes behind aqt.qt,
+loads anki and creates the QApplication, so the add-on's modules can be imported as "subsearch".
+Needs PyQt6 and anki (pip install aqt).
+"""
+
+import json
+import os
+import sys
+import types
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def install_aqt() -> None:
+    """Stands in for aqt, with the real Qt classes behind aqt.qt."""
+    from PyQt6 import QtCore, QtGui, QtWidgets
+    import anki.collection  # noqa: F401
+
+    mw = mock.MagicMock()
+    with open(os.path.join(ROOT, 'config.json'), encoding='utf-8') as f:
+        mw.addonManager.addonConfigDefaults.return_value = json.load(f)
+    mw.addonManager.getConfig.return_value = {'enable_debug_log': False}
+    aqt = types.ModuleType('aqt')
+    aqt.__path__ = []
+    aqt.mw = mw
+    aqt.gui_hooks = mock.MagicMock()
+    aqt.addcards = mock.MagicMock()
+    qt = types.ModuleType('aqt.qt')
+    for module in (QtCore, QtGui, QtWidgets):
+        qt.__dict__.update((name, value) for name, value in vars(module).items() if not name.startswith('_'))
+    # aqt.qt's star import hands these out too
+    qt.os, qt.sys = os, sys
+    qt.qconnect = lambda signal, slot: signal.connect(slot)
+    aqt.qt = qt
+    webview = types.ModuleType('aqt.webview')
+    webview.AnkiWebView = QtWidgets.QWidget
+    aqt.webview = webview
+    sys.modules.update({'aqt': aqt, 'aqt.qt': qt, 'aqt.webview': webview})
+    for name in ('utils', 'operations'):
+        sys.modules[f'aqt.{name}'] = module = mock.MagicMock()
+        setattr(aqt, name, module)
+    sys.modules['subsearch'] = package = types.ModuleType('subsearch')
+    package.__path__ = [ROOT]
+
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+install_aqt()
+
+from PyQt6.QtWidgets import QApplication  # noqa: E402
+
+app = QApplication([])
@@ -0,0 +1,15 @@
+# Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
+
+"""Imported first by the benchmarks, so the add-on's modules can be imported as "subsearch" without Anki."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests'))
+
+import anki_stubs  # noqa: E402,F401
+from subsearch.common import LogDebug  # noqa: E402
+
+# keeps the debug messages out of the numbers
+LogDebug.write = lambda self, msg: None
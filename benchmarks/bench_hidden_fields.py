@@ -0,0 +1,76 @@
+# Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
+
+"""
+Builds the note list's row texts of 10k notes with the precompiled HiddenFieldMatcher,
+and with the per-field keyword loop the rows used before. Needs PyQt6 and anki (pip install aqt).
+Run with: python3 benchmarks/bench_hidden_fields.py
+"""
+
+import time
+
+import _qt_stubs  # noqa: F401
+from subsearch.config import config
+from subsearch.widgets import NoteListModel
+
+NOTES = 10_000
+RUNS = 5
+
+
+def synthetic_notes() -> list[dict]:
+    media = 'https://us-southeast-1.linodeobjects.com/immersionkit/media/anime/some_title/media/'
+    return [{
+        'Expression': f'今日は学校に行かなくてもいいの？ {i}',
+        'ID': f'anime_some_title_{i:06}',
+        'Reading': f'今日[きょう]は 学校[がっこう]に 行[い]かなくてもいいの？ {i}',
+        'English': 'Is it okay if I don\'t go to school today?',
+        'source_info': 'some_title',
+        'needed_media': [f'{media}{i}.mp3', f'{media}{i}.jpg'],
+        'Audio': f'[sound:{i}.mp3]',
+        'Image': f'<img src="{i}.jpg"/>',
+    } for i in range(NOTES)]
+
+
+def keyword_loop(notes: list[dict], hide_fields: list[str]) -> list[str]:
+    """Row texts as NoteListModel built them before HiddenFieldMatcher."""
+    rows = []
+    for note in notes:
+        def is_hidden(field_name: str) -> bool:
+            field_name = field_name.lower()
+            return any(hidden_field.lower() in field_name for hidden_field in hide_fields)
+
+        rows.append(' | '.join(field_content
+            for field_name, field_content in note.items()
+            if not (is_hidden(field_name) or field_name == 'needed_media') and field_content.strip()
+        ))
+    return rows
+
+
+def matcher(notes: list[dict], hide_fields: list[str]) -> list[str]:
+    model = NoteListModel()
+    model.set_notes(notes, hide_fields=hide_fields)
+    return [model._row(row)[0] for row in range(len(notes))]
+
+
+def best_of(fn, *args) -> float:
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        fn(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    notes = synthetic_notes()
+    hide_fields = config['hidden_fields']
+    assert keyword_loop(notes, hide_fields) == matcher(notes, hide_fields)
+    old = best_of(keyword_loop, notes, hide_fields)
+    new = best_of(matcher, notes, hide_fields)
+    print(f'Row texts of {NOTES} notes, hiding {hide_fields}:')
+    print(f'  keyword loop per field: {old * 1000:.1f} ms')
+    print(f'  HiddenFieldMatcher:     {new * 1000:.1f} ms ({old / new:.1f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
+
+"""
+Formats a canned 500-example response with the Jlab format on, once building every note's Jlab fields
+right away as before LazyNote, and once the way a search does now: formatting the notes, listing a page
+of them and previewing the first. Needs pykakasi (pip install pykakasi).
+Run with: python3 benchmarks/bench_lazy_jlab.py
+"""
+
+import itertools
+import time
+from concurrent.futures import Future
+
+import _stubs  # noqa: F401
+from subsearch import note_getter
+from subsearch.config import config
+
+try:
+    import pykakasi
+except ImportError:
+    raise SystemExit('pykakasi is needed for this benchmark: pip install pykakasi')
+
+EXAMPLES = 500
+CLAUSES = [
+    '今日は学校に行かなくてもいいの', 'ちょっと待ってください', 'お前はもう死んでいる', '本当にありがとうございました',
+    '明日の朝早く出発します', 'この町には古い図書館がある', '先生に聞いてみたらどうですか', '雨が降りそうだから傘を持って行こう',
+    '彼女は毎日ピアノを練習している', 'どうしてそんなことを言うんだ', '電車が遅れて会議に間に合わなかった', '夏休みに海へ行きたいな',
+    '誰も知らない秘密を教えてあげる', '昨日の夜は星がとても綺麗だった', 'もう少しだけ頑張ってみよう', '約束を忘れないでね',
+    '兄は東京の大学で物理を勉強している', 'そのケーキは私が作ったんです', '静かにしないと怒られるよ', 'いつかまた会えるといいね',
+    '窓を開けてもいいですか', '駅までの道を教えてもらえますか', '猫が机の上で寝ている',
+]
+
+
+def canned_response() -> list[dict]:
+    # pairs of clauses, so the kakasi cache doesn't hit
+    sentences = ['、'.join(pair) + '。' for pair in itertools.permutations(CLAUSES, 2)][:EXAMPLES]
+    return [{
+        'id': f'example_{i}',
+        'sentence': sentence,
+        'sentence_with_furigana': sentence,
+        'translation': 'A translation of the sentence.',
+        'title': 'some_title',
+        'sound': f'example_{i}.mp3',
+        'image': f'example_{i}.jpg',
+        'word_list': [sentence[:2]],
+        'word_index': [0],
+    } for i, sentence in enumerate(sentences)]
+
+
+def fresh_kakasi_cache() -> None:
+    note_getter.kakasi_cache = note_getter.KakasiCache('', max_size=100_000, persist=False)
+
+
+def format_all(cards: list[dict]) -> list:
+    return [note_getter.format_note(card, 'https://example.com/media/', None) for card in cards]
+
+
+def eager(cards: list[dict]) -> float:
+    fresh_kakasi_cache()
+    start = time.perf_counter()
+    for note in format_all(cards):
+        dict(note.items())
+    return time.perf_counter() - start
+
+
+def lazy(cards: list[dict]) -> float:
+    fresh_kakasi_cache()
+    start = time.perf_counter()
+    notes = format_all(cards)
+    for note in notes[:config['notes_per_page']]:
+        ' | '.join(content for _, content in note.eager_items() if isinstance(content, str))
+    dict(notes[0].items())
+    return time.perf_counter() - start
+
+
+def main():
+    config['jlab_format'] = True
+    future = note_getter.kakasi_future = Future()
+    future.set_result(pykakasi.Kakasi())
+    cards = canned_response()
+    # kakasi loads its dictionaries on first use
+    note_getter.jlab_fields(cards[0], None)
+
+    old = min(eager(cards) for _ in range(3))
+    new = min(lazy(cards) for _ in range(3))
+    print(f'Formatting a {len(cards)}-example response with the Jlab format on:')
+    print(f'  Jlab fields of every note:              {old * 1000:.1f} ms')
+    print(f'  lazy, listing a page and previewing one: {new * 1000:.1f} ms ({old / new:.0f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
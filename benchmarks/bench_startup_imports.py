@@ -0,0 +1,63 @@
+# Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
+
+"""
+Compares the time to import the add-on's start-up modules (bootstrap) with importing the search window
+and settings dialog right away, as __init__ did before. Each side is imported in a fresh interpreter
+under -X importtime, with PyQt6 and anki loaded beforehand like in a running Anki (see _qt_stubs).
+Needs PyQt6 and anki (pip install aqt). Run with: python3 benchmarks/bench_startup_imports.py
+"""
+
+import re
+import subprocess
+import sys
+
+RUNS = 5
+SCENARIOS = {
+    'bootstrap (now)': ['subsearch.bootstrap'],
+    'eager (before)': ['subsearch.search_window', 'subsearch.settings_dialog', 'subsearch.quick_actions'],
+}
+
+
+def import_in_child(modules: list[str]) -> None:
+    import _qt_stubs  # noqa: F401
+    print('--- start ---', file=sys.stderr, flush=True)
+    for module in modules:
+        __import__(module)
+
+
+def addon_import_time(modules: list[str]) -> tuple[float, list[tuple[int, str]]]:
+    """Returns the cumulative import time in ms and the slowest of the imported modules."""
+    out = subprocess.run(
+        [sys.executable, '-X', 'importtime', __file__, '--child', *modules],
+        capture_output=True, text=True, check=True,
+    ).stderr
+    lines = out.split('--- start ---', 1)[1].splitlines()
+    entries = []
+    for line in lines:
+        if match := re.match(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)', line):
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((int(cumulative_us), len(indent), name))
+    top_level = sum(cumulative for cumulative, indent, _ in entries if indent == 1)
+    slowest = sorted(((cumulative, name) for cumulative, _, name in entries), reverse=True)
+    return top_level / 1000, slowest
+
+
+def main():
+    results = {}
+    for label, modules in SCENARIOS.items():
+        runs = [addon_import_time(modules) for _ in range(RUNS)]
+        results[label] = min(runs, key=lambda run: run[0])
+    print('Importing the add-on at start-up, best of', RUNS)
+    for label, (total, slowest) in results.items():
+        print(f'  {label:16} {total:7.1f} ms')
+    print('Slowest imports of the eager start-up:')
+    for cumulative, name in results['eager (before)'][1][:8]:
+        print(f'  {cumulative / 1000:7.1f} ms  {name}')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        import_in_child(sys.argv[2:])
+    else:
+        main()
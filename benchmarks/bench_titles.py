@@ -0,0 +1,48 @@
+# Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
+
+"""
+Compares resolving the titles of a 500-example response through the in-memory TitleIndex
+with opening and parsing data/titles.json for every example, as get_for did before.
+Run with: python3 benchmarks/bench_titles.py
+"""
+
+import json
+import timeit
+
+import _stubs  # noqa: F401
+from subsearch.titles import TITLES_PATH, TitleIndex
+
+EXAMPLES = 500
+RUNS = 20
+
+with open(TITLES_PATH, encoding='utf-8') as f:
+    SLUGS = list(json.load(f))
+RESPONSE_SLUGS = [SLUGS[i % len(SLUGS)] for i in range(EXAMPLES)]
+
+
+def parse_per_example() -> list:
+    titles = []
+    for slug in RESPONSE_SLUGS:
+        with open(TITLES_PATH, 'r', encoding='utf-8') as out:
+            titles.append(json.loads(out.read())[slug])
+    return titles
+
+
+def title_index() -> list:
+    # a new index every run, so loading the file once is part of the measurement
+    index = TitleIndex(TITLES_PATH)
+    return [index.lookup(slug) for slug in RESPONSE_SLUGS]
+
+
+def main():
+    assert parse_per_example() == title_index()
+    old = min(timeit.repeat(parse_per_example, number=RUNS, repeat=5)) / RUNS
+    new = min(timeit.repeat(title_index, number=RUNS, repeat=5)) / RUNS
+    print(f'Resolving the titles of {EXAMPLES} examples ({len(SLUGS)} titles in titles.json):')
+    print(f'  parsing titles.json per example: {old * 1000:.2f} ms')
+    print(f'  TitleIndex:                      {new * 1000:.2f} ms ({old / new:.0f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+# Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
+
+"""
+Registers the add-on's menu entries and hooks when Anki starts.
+Everything heavier (search window, settings dialog, previewer, importer)
+is only imported when it is first used.
+"""
+
+import time
+from os import path
+
+from aqt import mw, gui_hooks
+from aqt.operations import QueryOp
+from aqt.qt import QAction, qconnect
+from aqt.utils import showInfo, ask_user, show_critical
+
+from .common import ADDON_NAME, LogDebug, add_kakasi
+from .config import config
+from .subsearch_ajt.about_menu import menu_root_entry
+from . import quick_actions
+
+logDebug = LogDebug()
+
+
+def main_dialog():
+    """Returns the search window, building it on first use."""
+    if (d := getattr(mw, '_ani_main_dialog', None)) is None:
+        start = time.perf_counter()
+        from .search_window import MainDialog
+        d = mw._ani_main_dialog = MainDialog(parent=mw)
+        # react to anki's state changes
+        gui_hooks.profile_will_close.append(d.close)
+        logDebug(f'Built the search window in {(time.perf_counter() - start) * 1000:.1f} ms')
+    return d
+
+
+def open_search_window():
+    main_dialog().show()
+
+
+def open_settings():
+    from .settings_dialog import SubSearchSettingsDialog
+    dialog = SubSearchSettingsDialog(parent=mw)
+    dialog.exec()
+
+
+def open_mining_dialog(deck_id=None):
+    from .deck_miner import open_mining_dialog
+    open_mining_dialog(deck_id)
+
+
+def stop_mining():
+    # before the hooks of the lazily imported modules, which close their files and databases
+    if getattr(mw, '_ani_mining_dialog', None) is not None:
+        from .deck_miner import stop_mining
+        stop_mining()
+
+
+def _index_added_note(note):
+    # registered here, as id_index is only imported once the add-on is used
+    from .id_index import id_index
+    from .note_importer import is_subsearch_model
+    if is_subsearch_model(note.note_type()):
+        id_index.add_note(note)
+
+
+def _add_deck_options_entry(menu, deck_id):
+    qconnect(menu.addAction('Mine Sentences (SubSearch)...').triggered, lambda: open_mining_dialog(deck_id))
+
+
+def import_kakasi(r):
+    from . import note_getter
+    return note_getter.import_kakasi(r)
+
+
+def _update_jlab_cards(col):
+    from . import note_getter
+    return note_getter.update_jlab_cards(col)
+
+
+def _init_jlab_checks():
+    def on_finish(result):
+        if result:
+            showInfo(f"Successfully updated {0 if result == True else len(list(result))} notes. Jlab now works for them.")
+        else:
+            show_critical(
+                "Not able to update. Please check if Kakasi is installed by opening the SubSearch window.")
+
+    # check for not 1.2 converted cards
+    def check_12(col):
+        for model in col.models.all_names_and_ids():
+            if model.name.startswith('SubCard-JlabConverted'):
+                models_notes = col.models.nids(model.id)
+                if len(models_notes) > 0:
+                    example_note = col.get_note(models_notes[0])
+                    if not example_note['Jlab-ListeningFront'].strip():
+                        return 1
+    gui_hooks.main_window_did_init.append(lambda: QueryOp(parent=mw, op=check_12, success=lambda r:
+        ask_user("Sub2Srs Search:\n\nPlease update your cards for Jlab Compatibility.\nThis is required for Jlab to work and will need kakasi added to SubSearch.\n\nIf you want to do this afterwards, you have gotten a new option 'Update Jlab cards...' in the menu.",
+                lambda yes: QueryOp(parent=mw,
+                op=_update_jlab_cards,
+                success=on_finish).with_progress("Updating Jlab formatting...").run_in_background() if yes else 0) if r else 0).run_in_background())
+
+    # check for kakasi
+    if config["jlab_format"] and not path.exists(path.join(path.dirname(__file__), 'pykakasi', 'src', '__init__.py')):
+        logDebug("Pykakasi not found, asking for add...")
+        gui_hooks.main_window_did_init.append(lambda: ask_user("Sub2Srs Search:\n\nFor Jlab Format required pykakasi not found. Do you want to download it now?",
+                                                               lambda yes: add_kakasi(import_kakasi) if yes else 0))
+    elif config["jlab_format"]:
+        # kakasi loads in the background, start it once anki's window is up
+        gui_hooks.main_window_did_init.append(lambda: import_kakasi(1))
+
+
+def init():
+    start = time.perf_counter()
+
+    # get AJT menu
+    root_menu = menu_root_entry()
+    search_action = QAction('Search for Sub2Srs Cards...', root_menu)
+    qconnect(search_action.triggered, open_search_window)
+    mining_action = QAction('Mine Sentences for a Deck...', root_menu)
+    qconnect(mining_action.triggered, lambda: open_mining_dialog())
+    settings_action = QAction(f"{ADDON_NAME}'s Settings...", root_menu)
+    qconnect(settings_action.triggered, open_settings)
+    root_menu.addActions([search_action, mining_action, settings_action])
+    gui_hooks.deck_browser_will_show_options_menu.append(_add_deck_options_entry)
+    gui_hooks.profile_will_close.append(stop_mining)
+    gui_hooks.add_cards_did_add_note.append(_index_added_note)
+
+    quick_actions.init()
+    _init_jlab_checks()
+
+    logDebug(f'Add-on start-up took {(time.perf_counter() - start) * 1000:.1f} ms')
@@ -2,8 +2,8 @@
 # License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
 
 import os
+import re
 import zipfile
-import urllib.request
 from typing import Optional, TextIO
 from typing import NamedTuple
 
@@ -21,6 +21,7 @@ ADDON_NAME = 'SubSearch'
 class LogDebug:
     _logfile: Optional[TextIO] = None
     _instance = None
+    _cleared = False
 
     def __new__(cls, *args, **kwargs):
         if cls._instance is None:
@@ -37,8 +38,11 @@ class LogDebug:
         if not self._logfile:
             path = os.path.join(mw.pm.base, 'subsearch_debug.log')
             print(f'SubSearch: opening log file "{path}"')
-            # clear before writing to not have a large file somewhen
-            open(path, 'w').close()
+            # clear before writing to not have a large file somewhen, but only once per session,
+            # so that late messages of background work after a close don't wipe the log
+            if not LogDebug._cleared:
+                open(path, 'w').close()
+                LogDebug._cleared = True
             self._logfile = open(path, 'a')
         self._logfile.write(str(msg) + '\n')
         self._logfile.flush()
@@ -71,7 +75,32 @@ def sorted_decks_and_ids(col: Collection) -> list[NameId]:
     return sorted(NameId(deck.name, deck.id) for deck in col.decks.all_names_and_ids())
 
 
+def sanitize_term(term: str) -> str:
+    """Remove bracketed readings like （おお） and similar pairs, then trim.
+    Supports both ASCII and fullwidth brackets common in JP text.
+    """
+    if not term:
+        return ''
+    s = term
+    patterns = [
+        r"\([^)]*\)",           # ( ... )
+        r"（[^）]*）",             # （ ... ）
+        r"\[[^\]]*\]",         # [ ... ]
+        r"【[^】]*】",             # 【 ... 】
+        r"〈[^〉]*〉",             # 〈 ... 〉
+        r"《[^》]*》",             # 《 ... 《
+        r"「[^」]*」",             # 「 ... 」
+        r"『[^』]*』",             # 『 ... 』
+    ]
+    for pat in patterns:
+        s = re.sub(pat, '', s)
+    s = re.sub(r"\s+", " ", s).strip()
+    return s
+
+
 def add_kakasi(callback):
+    from .http_client import client
+
     logdebug = LogDebug()
     def download_pkg(links):
         for link in links:
@@ -79,7 +108,7 @@ def add_kakasi(callback):
             logdebug("Getting package "+pkg_name)
 
             try:
-                content = urllib.request.urlopen(link)
+                content = client.get(link)
             except IOError: 
                 return [0, pkg_name]
 
@@ -118,7 +147,7 @@ def add_kakasi(callback):
 
                                 continue
 
-            open(os.path.join(os.path.dirname(__file__), pkg_name+'.zip'), 'b+w').write(content.read())
+            open(os.path.join(os.path.dirname(__file__), pkg_name+'.zip'), 'b+w').write(content)
             os.makedirs(os.path.join(os.path.dirname(__file__), os.path.join(pkg_name, "src") if pkg_name == "pykakasi" else os.path.join('pykakasi', pkg_name)), exist_ok=True)
             join_zips_files(os.path.join(os.path.dirname(__file__), pkg_name+'.zip'), [f"/{pkg_name}/" if pkg_name != "pykakasi" else '/src/', "COPYING", "LICENSE", "kakasidict.py"], os.path.join(os.path.dirname(__file__), os.path.join(pkg_name, "src") if pkg_name == "pykakasi" else os.path.join('pykakasi', pkg_name)), pkg_name)
             os.remove(os.path.join(os.path.dirname(__file__), pkg_name+'.zip'))
@@ -0,0 +1,379 @@
+# Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
+
+"""
+Mines Immersion Kit sentences for the words of an existing deck.
+The job runs in the background and saves its progress to user_files after every batch of words,
+so it can be paused and continues where it stopped, also after restarting anki.
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from anki.utils import ids2str, split_fields, strip_html_media
+from aqt import mw
+from aqt.qt import *
+from aqt.utils import disable_help_button, restoreGeom, saveGeom, tooltip
+
+from .batch_search import best_notes
+from .common import ADDON_NAME, LogDebug, NameId, sanitize_term, sorted_decks_and_ids
+from .config import config
+from .id_index import id_index
+from .note_importer import import_notes, ImportResult
+from .quick_actions import load_profile_state, filters_from_state
+from .widgets import ComboBox, DeckCombo, SpinBox
+from . import note_getter
+
+logDebug = LogDebug()
+
+CHECKPOINT_DIR = os.path.join(os.path.dirname(__file__), 'user_files', 'mining')
+# words searched before their sentences are imported and the checkpoint is saved
+BATCH_SIZE = 20
+
+
+def _deck_ids(deck_id: int) -> list[int]:
+    return list(mw.col.decks.deck_and_child_ids(deck_id))
+
+
+def deck_field_names(deck_id: int) -> list[str]:
+    """Returns the field names of all note types used in the deck, in the order of their note types."""
+    mids = mw.col.db.list(f'select distinct n.mid from notes n join cards c on c.nid = n.id '
+                          f'where c.did in {ids2str(_deck_ids(deck_id))}')
+    names = (name for mid in mids if (model := mw.col.models.get(mid)) for name in mw.col.models.field_names(model))
+    return list(dict.fromkeys(names))
+
+
+def deck_words(deck_id: int, field_name: str) -> list[str]:
+    """Reads field_name of every note in the deck and its subdecks."""
+    nids = mw.col.db.list(f'select distinct nid from cards where did in {ids2str(_deck_ids(deck_id))}')
+    ords: dict[int, Optional[int]] = {}
+    words = []
+    for mid, flds in mw.col.db.execute(f'select mid, flds from notes where id in {ids2str(nids)} order by id'):
+        if mid not in ords:
+            field_names = mw.col.models.field_names(mw.col.models.get(mid))
+            ords[mid] = field_names.index(field_name) if field_name in field_names else None
+        if ords[mid] is not None and (word := sanitize_term(strip_html_media(split_fields(flds)[ords[mid]]))):
+            words.append(word)
+    return list(dict.fromkeys(words))
+
+
+class MiningCheckpoint:
+    """Settings and progress of the mining job of one deck, kept in user_files."""
+
+    def __init__(self, deck_id: int):
+        self.path = os.path.join(CHECKPOINT_DIR, f'{mw.pm.name}_{deck_id}.json')
+        self.deck_id = deck_id
+        self.field_name = ''
+        self.model_id = NameId.none_type().id
+        self.target_deck_id = deck_id
+        self.per_word = config['batch_import_per_term']
+        self.done: set[str] = set()
+        self.imported = 0
+        # words whose last search failed
+        self.failed: set[str] = set()
+
+    @property
+    def exists(self) -> bool:
+        return os.path.isfile(self.path)
+
+    def load(self) -> 'MiningCheckpoint':
+        try:
+            with open(self.path, encoding='utf8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return self
+        self.field_name = data['field_name']
+        self.model_id = data['model_id']
+        self.target_deck_id = data['target_deck_id']
+        self.per_word = data['per_word']
+        self.done = set(data['done'])
+        self.imported = data['imported']
+        self.failed = set(data['failed'])
+        return self
+
+    def save(self) -> None:
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        tmp_path = self.path + '.part'
+        with open(tmp_path, 'w', encoding='utf8') as f:
+            json.dump({
+                'field_name': self.field_name,
+                'model_id': self.model_id,
+                'target_deck_id': self.target_deck_id,
+                'per_word': self.per_word,
+                'done': sorted(self.done),
+                'imported': self.imported,
+                'failed': sorted(self.failed),
+            }, f, ensure_ascii=False)
+        # never leave a half written checkpoint behind
+        os.replace(tmp_path, self.path)
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class MiningJob:
+    """
+    Searches the words of a deck, at most batch_search_workers at a time, and imports the best sentences of each.
+    Progress is reported as (done, total, imported, failed) on the main thread.
+    """
+
+    def __init__(self, checkpoint: MiningCheckpoint, on_progress: Callable[[int, int, int, int], None],
+                 on_finished: Callable[[bool], None]):
+        self.checkpoint = checkpoint
+        self._on_progress = on_progress
+        self._on_finished = on_finished
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name='subsearch_mining', daemon=True)
+        self._thread.start()
+
+    def stop(self, wait: bool = False) -> None:
+        """
+        Stops before the next word is searched. Searches already underway are awaited but not imported,
+        an import that has already started is finished and saved.
+        """
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def _fetch(self, word: str, filters: list):
+        if self._stop.is_set():
+            return None
+        return note_getter.fetch_notes(note_getter.SEARCH_URL, word, extended_filters=filters)
+
+    def _report(self, done: int, total: int) -> None:
+        imported, failed = self.checkpoint.imported, len(self.checkpoint.failed)
+        mw.taskman.run_on_main(lambda: self._on_progress(done, total, imported, failed))
+
+    def _run(self) -> None:
+        finished = False
+        try:
+            finished = self._mine()
+        except Exception as err:
+            logDebug(f'Mining stopped with an error: {err}')
+        mw.taskman.run_on_main(lambda: self._on_finished(finished))
+
+    def _mine(self) -> bool:
+        checkpoint = self.checkpoint
+        words = deck_words(checkpoint.deck_id, checkpoint.field_name)
+        # words mined before, e.g. by an earlier job of the deck, as long as their examples weren't deleted
+        mined = id_index.mined_words()
+        checkpoint.done.update(word for word in words if word in mined)
+        pending = [word for word in words if word not in checkpoint.done]
+        logDebug(f'Mining {len(pending)} of {len(words)} words of deck {checkpoint.deck_id}')
+        filters = filters_from_state(load_profile_state())
+        start = time.perf_counter()
+        self._report(len(words) - len(pending), len(words))
+
+        with ThreadPoolExecutor(max_workers=max(1, config['batch_search_workers']), thread_name_prefix='subsearch_mining') as executor:
+            for batch_start in range(0, len(pending), BATCH_SIZE):
+                if self._stop.is_set():
+                    return False
+                batch = pending[batch_start:batch_start + BATCH_SIZE]
+                futures = [executor.submit(self._fetch, word, filters) for word in batch]
+                results = []
+                for future in futures:
+                    if self._stop.is_set():
+                        # words of an unfinished batch aren't in the checkpoint yet and are searched again next time
+                        for pending_future in futures:
+                            pending_future.cancel()
+                        return False
+                    results.append(future.result())
+                to_import = []
+                note_words = []
+                for word, notes in zip(batch, results):
+                    if isinstance(notes, Exception):
+                        # not marked as done, so the next run tries it again
+                        checkpoint.failed.add(word)
+                        continue
+                    best = best_notes(notes, checkpoint.per_word, checkpoint.model_id)
+                    to_import.extend(best)
+                    note_words.extend([word] * len(best))
+                    checkpoint.done.add(word)
+                    checkpoint.failed.discard(word)
+                if to_import:
+                    outcomes = import_notes(model_id=checkpoint.model_id, notes=to_import, deck_id=checkpoint.target_deck_id)
+                    checkpoint.imported += outcomes.count(ImportResult.success)
+                    mined_ids: dict[str, list[str]] = {}
+                    for word, note, outcome in zip(note_words, to_import, outcomes):
+                        if outcome == ImportResult.success:
+                            mined_ids.setdefault(word, []).append(note['ID'])
+                    id_index.add_mined(mined_ids)
+                checkpoint.save()
+                self._report(len(words) - len(pending) + batch_start + len(batch), len(words))
+        logDebug(f'Mined {len(pending)} words in {time.perf_counter() - start:.1f} s')
+        return True
+
+
+class MiningDialog(QDialog):
+    """Sets up and runs the mining job of a deck."""
+    name = 'subsearch_mining_dialog'
+
+    def __init__(self, parent: QWidget, deck_id: Optional[int] = None):
+        super().__init__(parent)
+        self._job: Optional[MiningJob] = None
+        self.deck_combo = DeckCombo()
+        self.field_combo = ComboBox()
+        self.target_deck_combo = DeckCombo()
+        self.note_type_combo = ComboBox()
+        self.per_word = SpinBox(1, 50, 1, config['batch_import_per_term'])
+        self.progress_bar = QProgressBar()
+        self.status_label = QLabel(wordWrap=True)
+        self.start_button = QPushButton('Start')
+        self.stop_button = QPushButton('Pause')
+        disable_help_button(self)
+        self._setup_ui()
+        self._populate(deck_id)
+        self.connect_elements()
+        restoreGeom(self, self.name, adjustSize=True)
+
+    def _setup_ui(self):
+        self.setWindowTitle(f'{ADDON_NAME}: Mine Sentences for a Deck')
+        self.setMinimumWidth(400)
+        self.stop_button.setEnabled(False)
+
+        form = QFormLayout()
+        form.addRow('Deck', self.deck_combo)
+        form.addRow('Word field', self.field_combo)
+        form.addRow('Sentences per word', self.per_word)
+        form.addRow('Into deck', self.target_deck_combo)
+        form.addRow('Map to note type', self.note_type_combo)
+
+        self.setLayout(layout := QVBoxLayout())
+        layout.addLayout(form)
+        layout.addWidget(self.progress_bar)
+        layout.addWidget(self.status_label)
+        layout.addLayout(buttons := QHBoxLayout())
+        buttons.addStretch()
+        buttons.addWidget(self.start_button)
+        buttons.addWidget(self.stop_button)
+
+    def _populate(self, deck_id: Optional[int]):
+        decks = sorted_decks_and_ids(mw.col)
+        self.deck_combo.set_decks(decks)
+        self.target_deck_combo.set_decks(decks)
+        self.note_type_combo.addItem(*NameId.none_type())
+        for note_type in mw.col.models.all_names_and_ids():
+            self.note_type_combo.addItem(note_type.name, note_type.id)
+        if deck_id is not None and (idx := self.deck_combo.findData(deck_id)) >= 0:
+            self.deck_combo.setCurrentIndex(idx)
+        self.load_deck()
+
+    def connect_elements(self):
+        qconnect(self.deck_combo.currentIndexChanged, self.load_deck)
+        qconnect(self.start_button.clicked, self.start)
+        qconnect(self.stop_button.clicked, self.stop)
+
+    def load_deck(self):
+        """Shows the fields of the selected deck and the settings of its unfinished job, if there is one."""
+        deck_id = self.deck_combo.currentData()
+        checkpoint = MiningCheckpoint(deck_id).load()
+        self.field_combo.clear()
+        self.field_combo.addItems(deck_field_names(deck_id))
+        if checkpoint.exists:
+            self.field_combo.setCurrentText(checkpoint.field_name)
+            self.per_word.setValue(checkpoint.per_word)
+            self.target_deck_combo.setCurrentIndex(max(0, self.target_deck_combo.findData(checkpoint.target_deck_id)))
+            self.note_type_combo.setCurrentIndex(max(0, self.note_type_combo.findData(checkpoint.model_id)))
+            self.status_label.setText(f'Unfinished job: {len(checkpoint.done)} words done, '
+                                      f'{checkpoint.imported} sentences imported.')
+            self.start_button.setText('Resume')
+        else:
+            self.target_deck_combo.setCurrentIndex(max(0, self.target_deck_combo.findData(deck_id)))
+            self.status_label.setText('')
+            self.start_button.setText('Start')
+        self.progress_bar.reset()
+
+    def start(self):
+        if not self.field_combo.currentText():
+            return tooltip('The deck has no notes.', parent=self)
+        checkpoint = MiningCheckpoint(self.deck_combo.currentData()).load()
+        if checkpoint.field_name != self.field_combo.currentText():
+            # another field means other words, start over
+            checkpoint.done.clear()
+        checkpoint.field_name = self.field_combo.currentText()
+        checkpoint.per_word = self.per_word.value()
+        checkpoint.target_deck_id = self.target_deck_combo.currentData()
+        checkpoint.model_id = self.note_type_combo.currentData()
+        checkpoint.save()
+
+        self._job = MiningJob(checkpoint, on_progress=self._on_progress, on_finished=self._on_finished)
+        self._job.start()
+        self._set_running(True)
+        self.status_label.setText('Reading words...')
+
+    def stop(self):
+        if self._job is not None:
+            self._job.stop()
+            self.stop_button.setEnabled(False)
+            self.status_label.setText('Pausing after the current batch...')
+
+    def stop_and_wait(self):
+        if self._job is not None and self._job.running:
+            self._job.stop(wait=True)
+
+    def _set_running(self, running: bool):
+        for widget in (self.deck_combo, self.field_combo, self.per_word, self.target_deck_combo,
+                       self.note_type_combo, self.start_button):
+            widget.setEnabled(not running)
+        self.stop_button.setEnabled(running)
+
+    def _on_progress(self, done: int, total: int, imported: int, failed: int):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+        self.status_label.setText(f'{done}/{total} words done, {imported} sentences imported'
+                                  + (f', {failed} searches failed.' if failed else '.'))
+
+    def _on_finished(self, finished: bool):
+        self._set_running(False)
+        checkpoint = self._job.checkpoint
+        if finished and not checkpoint.failed:
+            checkpoint.remove()
+            self.start_button.setText('Start')
+            self.status_label.setText(f'Done. {checkpoint.imported} sentences imported.')
+        elif finished:
+            # kept, so resuming searches the failed words again
+            self.start_button.setText('Resume')
+            self.status_label.setText(f'Done. {checkpoint.imported} sentences imported, '
+                                      f'{len(checkpoint.failed)} searches failed. Resume to retry them.')
+        else:
+            self.start_button.setText('Resume')
+            self.status_label.setText(f'Paused. {len(checkpoint.done)} words done, {checkpoint.imported} sentences imported.')
+        if mw.col is not None:
+            mw.reset()
+
+    def done(self, result: int) -> None:
+        # the checkpoint keeps the progress, so closing the window pauses the job
+        self.stop()
+        saveGeom(self, self.name)
+        return super().done(result)
+
+
+def open_mining_dialog(deck_id: Optional[int] = None):
+    if (dialog := getattr(mw, '_ani_mining_dialog', None)) is None:
+        dialog = mw._ani_mining_dialog = MiningDialog(mw, deck_id)
+    elif deck_id is not None and not (dialog._job and dialog._job.running):
+        dialog.deck_combo.setCurrentIndex(max(0, dialog.deck_combo.findData(deck_id)))
+    dialog.show()
+    dialog.activateWindow()
+
+
+def stop_mining():
+    # the collection closes next, a running import has to finish first
+    if (dialog := getattr(mw, '_ani_mining_dialog', None)) is not None:
+        dialog.stop_and_wait()
+        dialog.close()
+        mw._ani_mining_dialog = None
@@ -0,0 +1,414 @@
+# Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
+
+import email.utils
+import http.client
+import io
+import random
+import threading
+import time
+import zlib
+from typing import Optional
+from urllib import error, parse
+
+from aqt import gui_hooks
+
+from .common import LogDebug
+from .config import config
+
+logDebug = LogDebug()
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) AnkiAddon/1.0 Safari/537.36"
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+CHUNK_SIZE = 64 * 1024
+# what reading a response body can raise, a connection breaking off included
+TRANSFER_ERRORS = (OSError, http.client.HTTPException, zlib.error)
+# backoff between retries, in seconds
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30
+# a server asking to wait longer than this is given up on instead
+MAX_RETRY_AFTER = 60
+
+
+def retry_after(headers) -> Optional[float]:
+    """Returns the seconds a Retry-After header asks to wait, given as seconds or as a date."""
+    if not headers or not (value := headers.get('Retry-After')):
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter, so parallel requests don't retry in lockstep."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+class CircuitOpenError(error.URLError):
+    """Raised instead of sending a request to a host that failed too often in a row."""
+
+
+class TokenBucket:
+    """Allows rate requests per second on average, and bursts of up to burst requests."""
+
+    def __init__(self, rate: float, burst: float):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Waits until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._burst, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Stops requests to a host after threshold failures in a row. After cooldown seconds
+    a single request is let through again, and its outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, host: str, *, threshold: int, cooldown: float):
+        self.host = host
+        self._threshold = threshold
+        self._cooldown = cooldown
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def check(self) -> None:
+        """Raises CircuitOpenError if no request may be sent right now."""
+        if self._threshold <= 0:
+            return
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self._cooldown - time.monotonic()
+            if remaining > 0 or self._trial_running:
+                raise CircuitOpenError(f'{self.host} seems to be down, trying again in {max(remaining, 0):.0f} s')
+            self._trial_running = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._opened_at is not None:
+                logDebug(f'{self.host} is reachable again')
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if 0 < self._threshold <= self._failures:
+                if self._opened_at is None:
+                    logDebug(f'{self.host} failed {self._failures} times in a row, pausing requests for {self._cooldown} s')
+                self._opened_at = time.monotonic()
+
+
+class ConnectionPool:
+    """Keeps up to max_size keep-alive connections to one scheme://host:port."""
+
+    def __init__(self, scheme: str, host: str, port: Optional[int], *,
+                 max_size: int, connect_timeout: float, read_timeout: float):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._max_size = max_size
+        self._idle: list[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self.opened = 0
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        cls = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+        conn = cls(self.host, self.port, timeout=self._connect_timeout)
+        conn.connect()
+        # the connect timeout only applies to the handshake, reads use their own
+        conn.sock.settimeout(self._read_timeout)
+        self.opened += 1
+        return conn
+
+    def acquire(self) -> tuple[http.client.HTTPConnection, bool]:
+        """Returns a connection and whether it has been used before."""
+        self._slots.acquire()
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        try:
+            return self._new_connection(), False
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn: http.client.HTTPConnection, reusable: bool) -> None:
+        with self._lock:
+            if reusable and len(self._idle) < self._max_size:
+                self._idle.append(conn)
+            else:
+                conn.close()
+        self._slots.release()
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._idle:
+                conn.close()
+            self._idle.clear()
+
+
+class HttpResponse:
+    """
+    Body of a response with transparent gzip/deflate decoding.
+    Closing it hands the connection back to its pool.
+    """
+
+    def __init__(self, url: str, pool: ConnectionPool, conn: http.client.HTTPConnection,
+                 resp: http.client.HTTPResponse):
+        self.url = url
+        self.status = resp.status
+        self.headers = resp.headers
+        self._pool = pool
+        self._conn: Optional[http.client.HTTPConnection] = conn
+        self._resp = resp
+        self._buffer = b''
+        self._eof = False
+        encoding = (resp.getheader('Content-Encoding') or '').lower()
+        if encoding == 'gzip':
+            self._decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif encoding == 'deflate':
+            self._decoder = zlib.decompressobj()
+        else:
+            self._decoder = None
+
+    def _read_raw(self) -> bytes:
+        # read1 returns what has arrived instead of waiting for a whole chunk
+        chunk = self._resp.read1(CHUNK_SIZE)
+        if not chunk:
+            # http.client returns b'' instead of raising when the server closes early
+            if self._resp.length:
+                raise http.client.IncompleteRead(b'', self._resp.length)
+            if self._decoder and not self._decoder.eof:
+                raise http.client.IncompleteRead(b'')
+            self._eof = True
+            return self._decoder.flush() if self._decoder else b''
+        return self._decoder.decompress(chunk) if self._decoder else chunk
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        while not self._eof and (amt is None or len(self._buffer) < amt):
+            self._buffer += self._read_raw()
+        if amt is None:
+            data, self._buffer = self._buffer, b''
+        else:
+            data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+    def read1(self, amt: int = CHUNK_SIZE) -> bytes:
+        """Returns up to amt bytes of what has arrived so far, only waiting if nothing has. Returns b'' at the end."""
+        while not self._buffer and not self._eof:
+            self._buffer += self._read_raw()
+        data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+    def close(self) -> None:
+        if self._conn is None:
+            return
+        reusable = self._eof and not self._resp.will_close
+        self._resp.close()
+        self._pool.release(self._conn, reusable)
+        self._conn = None
+
+    def __enter__(self) -> 'HttpResponse':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+class HttpClient:
+    """
+    HTTP client sharing keep-alive connections per host between all requests of the add-on.
+    Requests are throttled per host, retried on 429 and 5xx responses and refused while a host is down.
+    """
+
+    def __init__(self, *, connect_timeout: float, read_timeout: float, pool_size: int,
+                 rate_limits: Optional[dict[str, float]] = None, retries: int = 0,
+                 failure_threshold: int = 0, cooldown: float = 0):
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._pool_size = max(1, pool_size)
+        self._pools: dict[tuple[str, str, Optional[int]], ConnectionPool] = {}
+        self._rate_limits = rate_limits or {}
+        self._buckets: dict[str, Optional[TokenBucket]] = {}
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._retries = max(0, retries)
+        self._failure_threshold = failure_threshold
+        self._cooldown = cooldown
+        self._lock = threading.Lock()
+
+    def _bucket_for(self, host: str) -> Optional[TokenBucket]:
+        with self._lock:
+            if host not in self._buckets:
+                rate = self._rate_limits.get(host)
+                # hosts without a budget aren't throttled
+                self._buckets[host] = TokenBucket(rate, burst=max(1.0, rate)) if rate and rate > 0 else None
+            return self._buckets[host]
+
+    def _breaker_for(self, host: str) -> CircuitBreaker:
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(host, threshold=self._failure_threshold, cooldown=self._cooldown)
+            return self._breakers[host]
+
+    def _pool_for(self, scheme: str, host: str, port: Optional[int]) -> ConnectionPool:
+        key = (scheme, host, port)
+        with self._lock:
+            if key not in self._pools:
+                self._pools[key] = ConnectionPool(scheme, host, port,
+                                                  max_size=self._pool_size,
+                                                  connect_timeout=self._connect_timeout,
+                                                  read_timeout=self._read_timeout)
+            return self._pools[key]
+
+    def _send(self, url: str, headers: dict[str, str]) -> HttpResponse:
+        parts = parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise error.URLError(f'unsupported url scheme: {parts.scheme}')
+        pool = self._pool_for(parts.scheme, parts.hostname, parts.port)
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+
+        while True:
+            try:
+                conn, reused = pool.acquire()
+            except (OSError, http.client.HTTPException) as err:
+                raise error.URLError(err) from err
+            try:
+                conn.request('GET', target, headers=headers)
+                return HttpResponse(url, pool, conn, conn.getresponse())
+            except (OSError, http.client.HTTPException) as err:
+                pool.release(conn, reusable=False)
+                if reused:
+                    # the server may have dropped an idle keep-alive connection, retry on a fresh one
+                    continue
+                raise error.URLError(err) from err
+
+    def open(self, url: str, headers: Optional[dict[str, str]] = None) -> HttpResponse:
+        """
+        Sends a GET request, follows redirects and raises HTTPError for error statuses.
+        429 and 5xx responses and connection errors are retried with backoff, honouring Retry-After.
+        Raises CircuitOpenError right away while the host is considered down.
+        """
+        request_headers = {
+            'User-Agent': USER_AGENT,
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        }
+        request_headers.update(headers or {})
+        host = parse.urlsplit(url).hostname or ''
+        breaker = self._breaker_for(host)
+        bucket = self._bucket_for(host)
+
+        for attempt in range(self._retries + 1):
+            breaker.check()
+            if bucket is not None:
+                bucket.acquire()
+            try:
+                resp = self._open(url, request_headers)
+            except error.HTTPError as err:
+                if err.code >= 500:
+                    breaker.record_failure()
+                else:
+                    # the server answered, a 429 is throttling and not an outage
+                    breaker.record_success()
+                if attempt == self._retries or not (err.code == 429 or err.code >= 500):
+                    raise
+                reason = f'HTTP {err.code}'
+                if (delay := retry_after(err.headers)) is None:
+                    delay = backoff_delay(attempt)
+                elif delay > MAX_RETRY_AFTER:
+                    raise
+            except error.URLError as err:
+                breaker.record_failure()
+                if attempt == self._retries:
+                    raise
+                delay = backoff_delay(attempt)
+                reason = getattr(err, 'reason', err)
+            except Exception:
+                # nothing else should escape _open, but a trial request must never stay marked as running
+                breaker.record_failure()
+                raise
+            else:
+                breaker.record_success()
+                return resp
+            logDebug(f'Request to {host} failed ({reason}), retry {attempt + 1}/{self._retries} in {delay:.1f} s')
+            time.sleep(delay)
+
+    def _open(self, url: str, request_headers: dict[str, str]) -> HttpResponse:
+        for _ in range(MAX_REDIRECTS + 1):
+            resp = self._send(url, request_headers)
+            if resp.status in REDIRECT_CODES and (location := resp.headers.get('Location')):
+                self._drain(resp)
+                url = parse.urljoin(url, location)
+                continue
+            if resp.status >= 400:
+                body = self._drain(resp)
+                raise error.HTTPError(url, resp.status, http.client.responses.get(resp.status, ''),
+                                      resp.headers, io.BytesIO(body))
+            return resp
+        raise error.URLError(f'too many redirects for {url}')
+
+    @staticmethod
+    def _drain(resp: HttpResponse) -> bytes:
+        """Reads the whole body of a redirect or error response, which frees its connection."""
+        try:
+            return resp.read()
+        except TRANSFER_ERRORS as err:
+            raise error.URLError(err) from err
+        finally:
+            resp.close()
+
+    def get(self, url: str, headers: Optional[dict[str, str]] = None) -> bytes:
+        """Returns the decoded body of url."""
+        with self.open(url, headers) as resp:
+            try:
+                return resp.read()
+            except TRANSFER_ERRORS as err:
+                raise error.URLError(err) from err
+
+    def close(self) -> None:
+        with self._lock:
+            for pool in self._pools.values():
+                pool.close()
+            self._pools.clear()
+
+
+client = HttpClient(
+    connect_timeout=config['http_connect_timeout'],
+    read_timeout=config['http_read_timeout'],
+    pool_size=config['http_pool_size'],
+    rate_limits=config['http_rate_limits'],
+    retries=config['http_retries'],
+    failure_threshold=config['circuit_breaker_threshold'],
+    cooldown=config['circuit_breaker_cooldown'],
+)
+gui_hooks.profile_will_close.append(client.close)
@@ -0,0 +1,136 @@
+# Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
+
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+from anki.notes import Note
+from anki.utils import ids2str, split_fields
+from aqt import mw, gui_hooks
+
+from .common import LogDebug
+
+logDebug = LogDebug()
+
+INDEX_PATH = os.path.join(os.path.dirname(__file__), 'user_files', 'imported_ids.sqlite')
+ID_FIELD = 'ID'
+
+
+class ImportedIdIndex:
+    """
+    Persistent Immersion Kit example ID -> anki note id index of the current profile.
+    Kept in memory for lookups and written through to SQLite in user_files.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._db: Optional[sqlite3.Connection] = None
+        self._profile: Optional[str] = None
+        self._nids: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            self._db = sqlite3.connect(self._path, check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS imported ('
+                'profile TEXT NOT NULL, example_id TEXT NOT NULL, nid INTEGER NOT NULL, '
+                'PRIMARY KEY (profile, example_id))'
+            )
+            # examples imported by the deck miner for a word
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS mined ('
+                'profile TEXT NOT NULL, word TEXT NOT NULL, example_id TEXT NOT NULL, '
+                'PRIMARY KEY (profile, word, example_id))'
+            )
+            self._db.commit()
+        return self._db
+
+    def _load(self) -> dict[str, int]:
+        if self._profile == mw.pm.name:
+            return self._nids
+        db = self._conn()
+        self._profile = mw.pm.name
+        self._nids = dict(db.execute('SELECT example_id, nid FROM imported WHERE profile = ?', (self._profile,)))
+        if self._nids:
+            self._prune(db)
+        # notes added while the index wasn't loaded, e.g. through anki's add dialog before the add-on was used
+        self._backfill(db, after_nid=max(self._nids.values(), default=0))
+        logDebug(f'Loaded {len(self._nids)} imported Immersion Kit IDs')
+        return self._nids
+
+    def _backfill(self, db: sqlite3.Connection, after_nid: int = 0) -> None:
+        """
+        Reads the IDs of notes newer than after_nid, e.g. imported before the index existed.
+        Only note types with the fields of a SubSearch one are read, an ID field of others means something else.
+        """
+        from .note_importer import is_subsearch_model
+
+        found: dict[str, int] = {}
+        for model in mw.col.models.all():
+            if not is_subsearch_model(model):
+                continue
+            ord_ = mw.col.models.field_names(model).index(ID_FIELD)
+            for nid, flds in mw.col.db.execute('select id, flds from notes where mid = ? and id > ?', model['id'], after_nid):
+                if (example_id := split_fields(flds)[ord_].strip()) and example_id not in self._nids:
+                    found.setdefault(example_id, nid)
+        if found:
+            self._nids.update(found)
+            db.executemany('INSERT OR REPLACE INTO imported VALUES (?, ?, ?)',
+                           ((self._profile, example_id, nid) for example_id, nid in found.items()))
+            db.commit()
+
+    def _prune(self, db: sqlite3.Connection) -> None:
+        """Drops entries whose notes were deleted."""
+        existing = set(mw.col.db.list(f'select id from notes where id in {ids2str(set(self._nids.values()))}'))
+        if stale := [example_id for example_id, nid in self._nids.items() if nid not in existing]:
+            for example_id in stale:
+                del self._nids[example_id]
+            db.executemany('DELETE FROM imported WHERE profile = ? AND example_id = ?',
+                           ((self._profile, example_id) for example_id in stale))
+            db.commit()
+
+    def nid_for(self, example_id) -> Optional[int]:
+        with self._lock:
+            return self._load().get(str(example_id))
+
+    def add(self, example_id, nid: int) -> None:
+        with self._lock:
+            self._load()[str(example_id)] = nid
+            self._conn().execute('INSERT OR REPLACE INTO imported VALUES (?, ?, ?)', (self._profile, str(example_id), nid))
+            self._conn().commit()
+
+    def add_note(self, note: Note) -> None:
+        if ID_FIELD in note and (example_id := note[ID_FIELD].strip()):
+            self.add(example_id, note.id)
+
+    def add_mined(self, mined: dict[str, list[str]]) -> None:
+        """Remembers the examples imported for each word by the deck miner."""
+        with self._lock:
+            self._load()
+            self._conn().executemany('INSERT OR REPLACE INTO mined VALUES (?, ?, ?)', (
+                (self._profile, word, str(example_id)) for word, example_ids in mined.items() for example_id in example_ids
+            ))
+            self._conn().commit()
+
+    def mined_words(self) -> set[str]:
+        """Returns the words that have a mined example which is still in the collection."""
+        with self._lock:
+            nids = self._load()
+            rows = self._conn().execute('SELECT word, example_id FROM mined WHERE profile = ?', (self._profile,))
+            return {word for word, example_id in rows if example_id in nids}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+            self._profile = None
+            self._nids = {}
+
+
+id_index = ImportedIdIndex(INDEX_PATH)
+gui_hooks.profile_will_close.append(id_index.close)
@@ -0,0 +1,134 @@
+# Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
+
+import codecs
+import json
+from typing import Any
+
+WHITESPACE = ' \t\n\r'
+DELIMITERS = ',:]}'
+
+# parser states
+OBJECT_START, KEY_FIRST, KEY, COLON, VALUE, MEMBER_END, ITEM_FIRST, ITEM, ITEM_END, DONE = range(10)
+
+
+class ObjectStreamParser:
+    """
+    Parses a JSON object while it is being received.
+    The elements of the array member stream_key are handed out as soon as each of them is complete,
+    all other members are parsed whole once they are.
+    Input json.loads rejects is rejected as well, as is a top-level value that isn't an object.
+    """
+
+    def __init__(self, stream_key: str):
+        self._stream_key = stream_key
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._decoder = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._state = OBJECT_START
+        self._key = ''
+        self._final = False
+        self.result: dict[str, Any] = {}
+        self.items: list = []
+
+    def feed(self, data: bytes, final: bool = False) -> list:
+        """Parses data, returns the elements of the streamed array it completed. Raises JSONDecodeError on invalid input."""
+        self._buf = self._buf[self._pos:] + self._utf8.decode(data, final)
+        self._pos = 0
+        self._final = final
+        start = len(self.items)
+        while self._state != DONE and self._step():
+            pass
+        if self._state == DONE and self._skip_whitespace():
+            raise json.JSONDecodeError('Extra data', self._buf, self._pos)
+        if final and self._state != DONE:
+            raise json.JSONDecodeError('Unexpected end of data', self._buf, len(self._buf))
+        return self.items[start:]
+
+    def _skip_whitespace(self) -> bool:
+        """Moves to the next token, returns False if there is none yet."""
+        while self._pos < len(self._buf) and self._buf[self._pos] in WHITESPACE:
+            self._pos += 1
+        return self._pos < len(self._buf)
+
+    def _expect(self, chars: str) -> str:
+        char = self._buf[self._pos]
+        if char not in chars:
+            raise json.JSONDecodeError(f'Expecting one of {chars!r}', self._buf, self._pos)
+        self._pos += 1
+        return char
+
+    def _decode_value(self) -> tuple[bool, Any]:
+        """
+        Decodes the value at the current position. A value only counts as complete once a delimiter follows it,
+        a number at the end of the buffer (like "-2." of "-2.5e3") could still continue in the next chunk.
+        """
+        try:
+            value, end = self._decoder.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            if self._final:
+                raise
+            return False, None
+        pos = end
+        while pos < len(self._buf) and self._buf[pos] in WHITESPACE:
+            pos += 1
+        if not self._final and (pos == len(self._buf) or self._buf[pos] not in DELIMITERS):
+            return False, None
+        self._pos = end
+        return True, value
+
+    def _step(self) -> bool:
+        """Consumes one token, returns False if more data is needed."""
+        if not self._skip_whitespace():
+            return False
+        state = self._state
+        if state == OBJECT_START:
+            self._expect('{')
+            self._state = KEY_FIRST
+        elif state in (KEY_FIRST, KEY):
+            # only an empty object may close where a key is expected, not a trailing comma
+            if state == KEY_FIRST and self._buf[self._pos] == '}':
+                self._pos += 1
+                self._state = DONE
+                return True
+            if self._buf[self._pos] != '"':
+                raise json.JSONDecodeError('Expecting property name enclosed in double quotes', self._buf, self._pos)
+            complete, key = self._decode_value()
+            if not complete:
+                return False
+            self._key = key
+            self._state = COLON
+        elif state == COLON:
+            self._expect(':')
+            self._state = VALUE
+        elif state == VALUE:
+            if self._key == self._stream_key and self._buf[self._pos] == '[':
+                self._pos += 1
+                self.result[self._key] = self.items
+                self._state = ITEM_FIRST
+                return True
+            complete, value = self._decode_value()
+            if not complete:
+                return False
+            self.result[self._key] = value
+            self._state = MEMBER_END
+        elif state == MEMBER_END:
+            self._state = KEY if self._expect(',}') == ',' else DONE
+        elif state == ITEM_FIRST:
+            if self._buf[self._pos] == ']':
+                self._pos += 1
+                self._state = MEMBER_END
+            else:
+                self._state = ITEM
+        elif state == ITEM:
+            if self._buf[self._pos] == ']':
+                raise json.JSONDecodeError('Expecting value', self._buf, self._pos)
+            complete, value = self._decode_value()
+            if not complete:
+                return False
+            self.items.append(value)
+            self._state = ITEM_END
+        elif state == ITEM_END:
+            self._state = ITEM if self._expect(',]') == ',' else MEMBER_END
+        return True
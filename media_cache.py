@@ -0,0 +1,167 @@
+# Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections.abc import Callable, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+from urllib import parse
+
+from aqt import gui_hooks
+
+from . import http_client
+from .common import LogDebug
+from .config import config
+
+logDebug = LogDebug()
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), 'user_files', 'media_cache')
+PREFETCH_WORKERS = 2
+
+
+class MediaCache:
+    """
+    Local copies of Immersion Kit media files, named after a hash of their url.
+    The least recently used files are removed once the folder exceeds max_bytes.
+    """
+
+    def __init__(self, path: str, *, max_bytes: int):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pending: dict[str, Future] = {}
+        self._waiters: dict[str, list[Callable[[str], None]]] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_bytes > 0
+
+    def _file_path(self, url: str) -> str:
+        ext = os.path.splitext(parse.urlsplit(url).path)[1]
+        return os.path.join(self._path, hashlib.sha1(url.encode('utf-8')).hexdigest() + ext)
+
+    def cached_path(self, url: str) -> Optional[str]:
+        """Returns the local copy of url or None if it isn't cached."""
+        if not self.enabled:
+            return None
+        path = self._file_path(url)
+        try:
+            # the mtime marks the last use
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def fetch(self, url: str) -> str:
+        """Returns the local copy of url, downloading it first if needed. Raises IOError on failure."""
+        if (path := self.cached_path(url)) is not None:
+            return path
+        path = self._file_path(url)
+        os.makedirs(self._path, exist_ok=True)
+        tmp = tempfile.NamedTemporaryFile(dir=self._path, prefix='.subsearch_', suffix='.part', delete=False)
+        try:
+            with tmp, http_client.client.open(parse.quote(url, safe=':/%')) as resp:
+                while chunk := resp.read(config['media_buffer_size']):
+                    tmp.write(chunk)
+            os.replace(tmp.name, path)
+        except BaseException:
+            os.remove(tmp.name)
+            raise
+        self._evict()
+        return path
+
+    def _evict(self) -> None:
+        with self._lock:
+            files = []
+            for entry in os.scandir(self._path):
+                if entry.is_file() and not entry.name.startswith('.'):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in files)
+            if total <= self._max_bytes:
+                return
+            evicted = 0
+            for _, size, path in sorted(files):
+                if total <= self._max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                evicted += 1
+            logDebug(f'Evicted {evicted} files from the media cache')
+
+    def _notify(self, url: str) -> None:
+        with self._lock:
+            waiters = self._waiters.pop(url, [])
+        for callback in waiters:
+            try:
+                callback(url)
+            except Exception as err:
+                logDebug(f'Prefetch callback for {url} failed: {err}')
+
+    def _prefetch_one(self, url: str) -> None:
+        try:
+            self.fetch(url)
+        except http_client.TRANSFER_ERRORS as err:
+            logDebug(f'Unable to prefetch {url}: {err}')
+        finally:
+            with self._lock:
+                self._pending.pop(url, None)
+            self._notify(url)
+
+    def is_pending(self, url: str) -> bool:
+        with self._lock:
+            return url in self._pending
+
+    def when_fetched(self, url: str, callback: Callable[[str], None]) -> bool:
+        """
+        Calls callback with url from a worker thread once its prefetch is over, whether or not it succeeded.
+        Returns False without calling it if url isn't being prefetched.
+        """
+        with self._lock:
+            if url not in self._pending:
+                return False
+            self._waiters.setdefault(url, []).append(callback)
+            return True
+
+    def prefetch(self, urls: Iterable[str]) -> None:
+        """
+        Downloads urls into the cache in the background, skipping those already cached or underway.
+        Queued downloads of urls not in this call are dropped, so the newest ones don't wait behind them.
+        """
+        if not self.enabled:
+            return
+        urls = list(dict.fromkeys(urls))
+        dropped = []
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix='subsearch_prefetch')
+            wanted = set(urls)
+            for url, future in list(self._pending.items()):
+                if url not in wanted and future.cancel():
+                    del self._pending[url]
+                    dropped.append(url)
+            for url in urls:
+                if url in self._pending or os.path.isfile(self._file_path(url)):
+                    continue
+                self._pending[url] = self._executor.submit(self._prefetch_one, url)
+        for url in dropped:
+            self._notify(url)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            self._pending.clear()
+            self._waiters.clear()
+
+
+cache = MediaCache(CACHE_DIR, max_bytes=config['media_cache_max_mb'] * 1024 * 1024)
+gui_hooks.profile_will_close.append(cache.close)
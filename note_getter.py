@@ -1,35 +1,101 @@
 import json
-from urllib import request, parse, error
-import re
 import os
+from collections import OrderedDict
+from collections.abc import Callable, Sequence
+from typing import Optional
+from urllib import parse, error
+import re
+import threading
+import time
+from concurrent.futures import Future
 
-from aqt import mw
+from aqt import mw, gui_hooks
 from aqt.utils import tooltip
 
 space_pattern = re.compile(r'\s+')
 multi_space_pattern = re.compile(r'\s\s+')
 
-kakasi = False
+
+class JlabTranslationTable(dict):
+    """
+    str.translate table keeping alphanumeric characters and "[", spacing out "]"
+    and turning the NUL token separator into a space. Filled lazily per character.
+    """
+
+    def __missing__(self, code: int) -> Optional[str]:
+        char = chr(code)
+        if char == '\0':
+            value = ' '
+        elif char == ']':
+            value = ' ]'
+        elif char.isalnum() or char == '[':
+            value = char
+        else:
+            value = None
+        self[code] = value
+        return value
+
+
+jlab_translation_table = JlabTranslationTable()
+# fields of every note format_note builds, besides the optional Image, source_info and Jlab ones
+BASE_FIELD_NAMES = ('Expression', 'ID', 'Reading', 'English', 'Audio')
+JLAB_FIELD_NAMES = (
+    'Jlab-Kanji', 'Jlab-KanjiSpaced', 'Jlab-Hiragana', 'Jlab-KanjiCloze', 'Jlab-Lemma', 'Jlab-HiraganaCloze',
+    'Jlab-Translation', 'Jlab-DictionaryLookup', 'Jlab-Metadata', 'Jlab-Remarks', 'Other-Front',
+    'Jlab-ListeningFront', 'Jlab-ListeningBack', 'Jlab-ClozeFront', 'Jlab-ClozeBack',
+)
+KAKASI_CACHE_PATH = os.path.join(os.path.dirname(__file__), 'user_files', 'kakasi_cache.json')
+
+kakasi_future: Optional[Future] = None
 # Is being called upon anki startup from searchwindows init
 def import_kakasi(r):
+    """Starts loading kakasi and its dictionaries in a background thread."""
     if r and config["jlab_format"]:
-        from .pykakasi import src as pykakasi
-        global kakasi
-        kakasi = pykakasi.Kakasi()
+        global kakasi_future
+        call_start = time.perf_counter()
+        future = kakasi_future = Future()
+
+        def load():
+            load_start = time.perf_counter()
+            try:
+                from .pykakasi import src as pykakasi
+                future.set_result(pykakasi.Kakasi())
+            except Exception as err:
+                logDebug(f'Loading kakasi failed: {err}')
+                future.set_exception(err)
+            else:
+                logDebug(f'Loaded kakasi in {(time.perf_counter() - load_start) * 1000:.1f} ms off the main thread')
+
+        threading.Thread(target=load, name='subsearch-kakasi', daemon=True).start()
+        logDebug(f'Started loading kakasi, main thread blocked for {(time.perf_counter() - call_start) * 1000:.1f} ms')
+
+
+def get_kakasi():
+    """Waits until kakasi is loaded. Returns None if it isn't loaded or failed to load."""
+    if kakasi_future is None:
+        return None
+    try:
+        return kakasi_future.result()
+    except Exception:
+        return None
 
 from .common import LogDebug
 from .config import config
+from . import titles, http_client, search_cache, json_stream
 
 logDebug = LogDebug()
 
-cur_note_list = []
+SEARCH_URL = "https://apiv2.immersionkit.com/search"
 
+cur_note_list: Sequence[dict] = []
 
-def get_for(url, term: str, *, extended_filters: list[str, str, list[int, int], str, str, bool]) -> list[dict] or IOError:
+
+def build_search_url(url, term: str, extended_filters: list[str, str, list[int, int], str, str, bool]) -> str:
     """extended_filters = [category (0), sort (1), length_border (2), jlpt (3), wanikani (4), exact_match (5)]"""
     # build URL out of secured values
     if term: 
-        term = parse.quote(term)
+        # normalize whitespace, so equal searches share one cache entry
+        term = parse.quote(' '.join(term.split()))
     if extended_filters[0]: 
         category = extended_filters[0].lower()
     if extended_filters[1]: 
@@ -50,25 +116,69 @@ def get_for(url, term: str, *, extended_filters: list[str, str, list[int, int],
     # exactMatch: small boolean
     # limit: Number
     # sort: sentence_length:asc|desc 
-    encoded_url = (f'{url}?q={term}{"" if extended_filters[0] == "--" else ("&category=" + category)}'
-                   f'{"" if extended_filters[1] == "--" else ("&sort=" + sort)}'
-                   f'{"" if not extended_filters[2][0] else ("&min_length=" + min_len)}{"" if not extended_filters[2][1] else ("&max_length=" + max_len)}'
-                   f'{"" if extended_filters[3] == "--" else ("&jlpt=" + jlpt)}{"" if extended_filters[4] == "--" else ("&wk=" + wanikani)}'
-                   f'&exactMatch={str(extended_filters[5]).lower()}')
+    return (f'{url}?q={term}{"" if extended_filters[0] == "--" else ("&category=" + category)}'
+            f'{"" if extended_filters[1] == "--" else ("&sort=" + sort)}'
+            f'{"" if not extended_filters[2][0] else ("&min_length=" + min_len)}{"" if not extended_filters[2][1] else ("&max_length=" + max_len)}'
+            f'{"" if extended_filters[3] == "--" else ("&jlpt=" + jlpt)}{"" if extended_filters[4] == "--" else ("&wk=" + wanikani)}'
+            f'&exactMatch={str(extended_filters[5]).lower()}')
+
+
+def stream_response(encoded_url: str, term: str, on_first_page: Optional[Callable[['PagedNotes'], None]]) -> tuple[dict, bytes]:
+    """
+    Downloads and parses a search response at the same time. As soon as the examples of the first page
+    are in, they are converted and handed to on_first_page, while the rest is still being received.
+    Returns the parsed response and its raw body.
+    """
+    parser = json_stream.ObjectStreamParser('examples')
+    body = bytearray()
+    first_page = None
+    start = time.perf_counter()
+    with http_client.client.open(encoded_url, headers={"Accept": "application/json"}) as resp:
+        try:
+            while chunk := resp.read1():
+                body += chunk
+                parser.feed(chunk)
+                if on_first_page and first_page is None and len(parser.items) >= config['notes_per_page']:
+                    partial = parser.result
+                    first_page = PagedNotes({
+                        'deck_count': partial.get('deck_count', {}),
+                        'dictionary': partial.get('dictionary', []),
+                        'examples': parser.items[:config['notes_per_page']],
+                    }, term, report_missing=False)
+                    first_page.materialize(0, config['notes_per_page'])
+                    logDebug(f'First page ready after {(time.perf_counter() - start) * 1000:.1f} ms, {len(body)} bytes in')
+                    on_first_page(first_page)
+        except http_client.TRANSFER_ERRORS as err:
+            raise error.URLError(err) from err
+    parser.feed(b'', final=True)
+    logDebug(f'Received {len(parser.items)} examples ({len(body)} bytes) in {(time.perf_counter() - start) * 1000:.1f} ms')
+    return parser.result, bytes(body)
+
+
+def fetch_notes(url, term: str, *, extended_filters: list[str, str, list[int, int], str, str, bool],
+                on_first_page: Optional[Callable[['PagedNotes'], None]] = None) -> Sequence[dict] or IOError:
+    """
+    Like get_for, but leaves cur_note_list alone, so a search that got superseded doesn't replace the shown one.
+    on_first_page is called from the worker thread with the first page's notes while the rest still downloads.
+    """
+    encoded_url = build_search_url(url, term, extended_filters)
+    term = ' '.join(term.split()) if term else term
 
     logDebug(f'Getting card data for - {term}, {extended_filters[0]}, {extended_filters[1]}, {extended_filters[2]}, '
              f'{extended_filters[3]}, {extended_filters[4]}, {extended_filters[5]} ({encoded_url})')
+    first_page = None
+
+    def keep_first_page(notes: PagedNotes):
+        nonlocal first_page
+        first_page = notes
+        on_first_page(notes)
+
     try:
-        req = request.Request(
-            encoded_url,
-            headers={
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) AnkiAddon/1.0 Safari/537.36",
-                "Accept": "application/json",
-            },
-        )
-        with request.urlopen(req, timeout=10) as resp:
-            response = resp.read()
-        result = json.loads(response)
+        if (response := search_cache.cache.get(encoded_url)) is None:
+            result, response = stream_response(encoded_url, term or '', keep_first_page if on_first_page else None)
+            search_cache.cache.put(encoded_url, response)
+        else:
+            result = json.loads(response)
     except error.HTTPError as err:
         logDebug(f"HTTPError while fetching data: {err.code} {getattr(err, 'reason', '')}")
         return err
@@ -82,75 +192,341 @@ def get_for(url, term: str, *, extended_filters: list[str, str, list[int, int],
         logDebug(f"Unexpected error while fetching data: {err}")
         return err
 
+    logDebug('Formatting fetched card data')
+    format_start = time.perf_counter()
+    notes = PagedNotes(result, term or '')
+    if first_page is not None:
+        notes.adopt(first_page)
+    notes.materialize(0, config['notes_per_page'])
+    logDebug(f'Prepared {len(notes)} notes, formatted the first page in {(time.perf_counter() - format_start) * 1000:.1f} ms')
+
+    return notes
+
+
+def get_for(url, term: str, *, extended_filters: list[str, str, list[int, int], str, str, bool]) -> Sequence[dict] or IOError:
+    """extended_filters = [category (0), sort (1), length_border (2), jlpt (3), wanikani (4), exact_match (5)]"""
     global cur_note_list
-    cur_note_list = []
 
-    logDebug('Formatting fetched card data')
+    notes = fetch_notes(url, term, extended_filters=extended_filters)
+    if not isinstance(notes, Exception):
+        cur_note_list = notes
+    return notes
+
+
+def cached_prefix_notes(url, term: str, *, extended_filters: list[str, str, list[int, int], str, str, bool]) -> Optional['PagedNotes']:
+    """
+    Narrows down the cached response of the longest prefix of term to the examples containing term,
+    so something can be shown while the search for term itself is still running.
+    Returns None if term's own response is cached or no prefix is.
+    """
+    term = ' '.join(term.split())
+    if search_cache.cache.peek(build_search_url(url, term, extended_filters)) is not None:
+        return None
+    for end in range(len(term) - 1, 0, -1):
+        if (response := search_cache.cache.peek(build_search_url(url, term[:end], extended_filters))) is None:
+            continue
+        result = json.loads(response)
+        examples = [card for card in result['examples'] if term in card['sentence']]
+        logDebug(f'Showing {len(examples)} of {len(result["examples"])} cached results for "{term[:end]}" while searching "{term}"')
+        # the prefix' dictionary entry isn't the one of term
+        return PagedNotes({**result, 'examples': examples, 'dictionary': []}, term)
+    return None
+
 
+def format_note(card: dict, media_base_path: str, lemma: Optional[str]) -> 'LazyNote':
+    """Builds the note dict of one example of a search response."""
     # build up note dict. Simplified and no note, so it is easier to handle and not as big as a note
-    for card in result['examples']:
-        new_note = {
-            'Expression': card['sentence'],
-            'ID': card['id'],
-            'Reading': card['sentence_with_furigana'],
-            'English': card['translation'],
-            'source_info': f'{card["title"]}',
-            'needed_media': []
-        }
-
-        card_category = next((prop for prop, details in result['deck_count'].items() if card['title'] in details), None)
-        with open(os.path.join(os.path.dirname(__file__), "data", "titles.json"), 
-                "r", 
-                encoding="utf-8") as out:
-            real_title = json.loads(out.read())
-            
-            if not card["title"] in real_title:
-                tooltip("The database seems outdated. Please report this to the developer.\n(Title for "+card["title"]+" is missing)")
+    new_note = {
+        'Expression': card['sentence'],
+        'ID': card['id'],
+        'Reading': card['sentence_with_furigana'],
+        'English': card['translation'],
+        'source_info': f'{card["title"]}',
+        'needed_media': []
+    }
+
+    # UI and functionality combination
+    if config['fetch_anki_card_media']:
+        new_note["Audio"] = f'''<audio id="subsearch_{card["id"].replace('"', "'") +"."+ card["sound"].split(".")[-1]}_player" class="subsearch__fetch" src="{media_base_path + card["sound"]}"></audio>
+[sound:{media_base_path + card["sound"]}]'''
+    else:
+        new_note['Audio'] = f'[sound:{card["sound"]}]'
+        new_note['needed_media'].append(media_base_path+card['sound'])
+
+    # if card has no image don't add one
+    # also replace " with ' against image destruction
+    if 'image' in card and config['fetch_anki_card_media']:
+        new_note['Image'] = '<img src="'+media_base_path + card["image"]+'"/>'
+    elif 'image' in card:
+        new_note['Image'] = '<img src="'+card["image"] +'"/>'
+        new_note['needed_media'].append(media_base_path +card['image'])
+
+    if config['jlab_format'] and kakasi_future is not None:
+        return LazyNote(new_note, lambda: jlab_fields(card, lemma), JLAB_FIELD_NAMES)
+    return LazyNote(new_note)
+
+
+def jlab_spaced(kakasi_conv: list[dict]) -> tuple[str, str, str]:
+    """
+    Returns the space separated kanji, hiragana and hepburn strings of kakasi's tokens,
+    keeping only alphanumeric characters and brackets of each token.
+    """
+    orig, hira, hepburn = [], [], []
+    for word in kakasi_conv:
+        orig.append(word["orig"])
+        hira.append(word["hira"])
+        hepburn.append(word["hepburn"])
+
+    def spaced(tokens: list[str]) -> str:
+        return multi_space_pattern.sub(' ', '\0'.join(tokens).translate(jlab_translation_table))
+
+    return spaced(orig), spaced(hira), spaced(hepburn)
+
+
+class KakasiCache:
+    """
+    Bounded LRU cache of sentence -> jlab_spaced(kakasi.convert(sentence)).
+    Optionally saved to user_files when the profile closes, so it survives restarts.
+    """
+
+    def __init__(self, path: str, *, max_size: int, persist: bool):
+        self._path = path
+        self._max_size = max_size
+        self._persist = persist
+        self._entries: Optional[OrderedDict[str, tuple[str, str, str]]] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self) -> OrderedDict:
+        if self._entries is None:
+            self._entries = OrderedDict()
+            if self._persist and os.path.isfile(self._path):
+                try:
+                    with open(self._path, encoding='utf8') as f:
+                        self._entries.update((sentence, tuple(conv)) for sentence, conv in json.load(f))
+                except (OSError, ValueError) as err:
+                    logDebug(f'Unable to load kakasi cache: {err}')
+        return self._entries
+
+    def convert(self, sentence: str) -> tuple[str, str, str]:
+        with self._lock:
+            entries = self._load()
+            if (conv := entries.get(sentence)) is not None:
+                entries.move_to_end(sentence)
+                self.hits += 1
+                self._log_hit_rate()
+                return conv
+        conv = jlab_spaced(get_kakasi().convert(sentence))
+        with self._lock:
+            entries[sentence] = conv
+            while len(entries) > self._max_size:
+                entries.popitem(last=False)
+            self.misses += 1
+            self._log_hit_rate()
+        return conv
+
+    def _log_hit_rate(self) -> None:
+        if (lookups := self.hits + self.misses) % 100 == 0:
+            logDebug(f'Kakasi cache: {self.hits / lookups:.0%} hit rate over {lookups} lookups, {len(self._entries)} entries')
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._persist or self._entries is None:
+                return
+            try:
+                os.makedirs(os.path.dirname(self._path), exist_ok=True)
+                with open(self._path, 'w', encoding='utf8') as f:
+                    json.dump(list(self._entries.items()), f, ensure_ascii=False, separators=(',', ':'))
+            except OSError as err:
+                logDebug(f'Unable to save kakasi cache: {err}')
+
+
+kakasi_cache = KakasiCache(KAKASI_CACHE_PATH,
+                           max_size=config['kakasi_cache_size'],
+                           persist=config['persist_kakasi_cache'])
+gui_hooks.profile_will_close.append(kakasi_cache.save)
+
+
+def jlab_fields(card: dict, lemma: Optional[str]) -> dict:
+    """Builds the Jlab-* fields of one example. Runs kakasi, so only call it when the fields are needed."""
+    jlab = {}
+    if get_kakasi() is None:
+        return jlab
+    kanji_spaced, hiragana, listening = kakasi_cache.convert(card['sentence'])
+    # jlab takes the cloze position by splitting the string at spaces
+    # "  " = wanted_position + 1, if you say it programmatically
+    jlab['Jlab-Kanji'] = re.sub(multi_space_pattern, ' ', card['sentence'])
+    jlab['Jlab-KanjiSpaced'] = kanji_spaced
+    jlab['Jlab-Hiragana'] = hiragana
+    jlab['Jlab-KanjiCloze'] = jlab["Jlab-KanjiSpaced"]
+    # try replacing the searched word with it's deinflected form provided by the api
+    # not yet got any better method for this
+    jlab['Jlab-Lemma'] = jlab["Jlab-KanjiSpaced"] if lemma is None else jlab["Jlab-KanjiSpaced"].replace(card["word_list"][card["word_index"][0]], lemma)
+    jlab['Jlab-HiraganaCloze'] = jlab["Jlab-Hiragana"]
+    jlab['Jlab-Translation'] = card['translation']
+    jlab['Jlab-DictionaryLookup'] = ''
+    jlab['Jlab-Metadata'] = ''
+    jlab['Jlab-Remarks'] = ''
+    jlab['Other-Front'] = jlab["Jlab-KanjiCloze"]
+    # surprise, jlab is not needed.. (wasted a lot of hours on this). Jlab needs only the hiragana cloze and kanji matching each other
+    # shown roumaji are converted by them and displayed
+    jlab['Jlab-ListeningFront'] = listening
+    jlab['Jlab-ListeningBack'] = jlab['Jlab-ListeningFront']
+    jlab['Jlab-ClozeFront'] = jlab['Jlab-ListeningFront']
+    jlab['Jlab-ClozeBack'] = jlab['Jlab-ListeningFront']
+
+    return jlab
+
+
+class LazyNote(dict):
+    """
+    Note dict whose Jlab fields are only built the first time the whole note is accessed,
+    e.g. to preview, import or edit it.
+    """
+
+    def __init__(self, fields: dict, lazy_fields: Optional[Callable[[], dict]] = None, lazy_names: Sequence[str] = ()):
+        super().__init__(fields)
+        self._lazy_fields = lazy_fields
+        self._lazy_names = lazy_names
+        self._lock = threading.Lock()
+
+    def _materialize(self) -> None:
+        if self._lazy_fields is None:
+            return
+        with self._lock:
+            if self._lazy_fields is not None:
+                super().update(self._lazy_fields())
+                self._lazy_fields = None
+
+    def eager_items(self):
+        """Fields that are available without building the lazy ones."""
+        return super().items()
+
+    def field_names(self) -> list[str]:
+        """Names of all fields, including the lazy ones, without building them."""
+        if self._lazy_fields is None:
+            return list(super().keys())
+        return [*super().keys(), *self._lazy_names]
+
+    def _is_pending(self, key) -> bool:
+        return self._lazy_fields is not None and key in self._lazy_names
+
+    def __getitem__(self, key):
+        if not super().__contains__(key) and self._is_pending(key):
+            self._materialize()
+        return super().__getitem__(key)
+
+    def __contains__(self, key) -> bool:
+        if super().__contains__(key):
+            return True
+        # only one of the lazy fields is worth building them for, any other key is missing either way
+        if self._is_pending(key):
+            self._materialize()
+            return super().__contains__(key)
+        return False
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __iter__(self):
+        self._materialize()
+        return super().__iter__()
+
+    def __len__(self) -> int:
+        self._materialize()
+        return super().__len__()
+
+    def keys(self):
+        self._materialize()
+        return super().keys()
+
+    def values(self):
+        self._materialize()
+        return super().values()
+
+    def items(self):
+        self._materialize()
+        return super().items()
+
+    def copy(self) -> dict:
+        self._materialize()
+        return dict(super().items())
+
+
+class PagedNotes(Sequence):
+    """
+    Notes of one search response. Titles and media paths are resolved for all examples up front,
+    the notes themselves are only built once their page is requested.
+    """
+
+    def __init__(self, result: dict, term: str, *, report_missing: bool = True):
+        categories = titles.category_index.update(result['deck_count'])
+        missing_titles = set()
+        missing_categories = set()
+
+        self._cards: list[tuple[dict, str]] = []
+        for card in result['examples']:
+            real_title = titles.lookup(card['title'])
+            if real_title is None:
+                missing_titles.add(card['title'])
                 continue
-            real_title = real_title[card['title']]
+            card_category = categories.get(card['title']) or titles.category_index.lookup(card['title'])
+            if card_category is None:
+                missing_categories.add(card['title'])
+            media_base_path = f"https://us-southeast-1.linodeobjects.com/immersionkit/media/{card_category}/{real_title}/media/"
+            self._cards.append((card, media_base_path))
 
-        media_base_path = f"https://us-southeast-1.linodeobjects.com/immersionkit/media/{card_category}/{real_title}/media/"
+        if missing_categories:
+            logDebug(f'No category known for: {", ".join(sorted(missing_categories))}')
+        if missing_titles and report_missing:
+            logDebug(f'Titles missing in titles.json: {", ".join(sorted(missing_titles))}')
+            tooltip("The database seems outdated. Please report this to the developer.\n"
+                    f"(Titles for {', '.join(sorted(missing_titles))} are missing)")
 
-        # UI and functionality combination
-        if config['fetch_anki_card_media']:
-            new_note["Audio"] = f'''<audio id="subsearch_{card["id"].replace('"', "'") +"."+ card["sound"].split(".")[-1]}_player" class="subsearch__fetch" src="{media_base_path + card["sound"]}"></audio>
-[sound:{media_base_path + card["sound"]}]'''
+        dictionary = result["dictionary"]
+        if len(dictionary) == 0 or len(dictionary[0]) == 0 or dictionary[0][0]["headword"] == term:
+            self._lemma = None
         else:
-            new_note['Audio'] = f'[sound:{card["sound"]}]'
-            new_note['needed_media'].append(media_base_path+card['sound'])
-
-        # if card has no image don't add one
-        # also replace " with ' against image destruction
-        if 'image' in card and config['fetch_anki_card_media']:
-            new_note['Image'] = '<img src="'+media_base_path + card["image"]+'"/>'
-        elif 'image' in card:
-            new_note['Image'] = '<img src="'+card["image"] +'"/>'
-            new_note['needed_media'].append(media_base_path +card['image'])
-
-        if config['jlab_format'] and kakasi:
-            kakasi_conv = kakasi.convert(card['sentence'])
-            # jlab takes the cloze position by splitting the string at spaces
-            # "  " = wanted_position + 1, if you say it programmatically
-            new_note['Jlab-Kanji'] = re.sub(multi_space_pattern, ' ', card['sentence'])
-            new_note['Jlab-KanjiSpaced'] = re.sub(multi_space_pattern, ' ', " ".join(''.join(e for e in word["orig"] if e.isalnum() or e in ['[',']']) for word in kakasi_conv).replace("]", " ]"))
-            new_note['Jlab-Hiragana'] = re.sub(multi_space_pattern, ' ', " ".join(''.join(e for e in word["hira"] if e.isalnum() or e in ['[',']']) for word in kakasi_conv).replace("]", " ]"))
-            new_note['Jlab-KanjiCloze'] = new_note["Jlab-KanjiSpaced"]
-            # try replacing the searched word with it's deinflected form provided by the api
-            # not yet got any better method for this
-            new_note['Jlab-Lemma'] = new_note["Jlab-KanjiSpaced"] if len(result["dictionary"]) == 0 or len(result["dictionary"][0]) == 0 or result["dictionary"][0][0]["headword"] == parse.unquote(term) else new_note["Jlab-KanjiSpaced"].replace(card["word_list"][card["word_index"][0]], result["dictionary"][0][0]['headword'])
-            new_note['Jlab-HiraganaCloze'] = new_note["Jlab-Hiragana"]
-            new_note['Jlab-Translation'] = card['translation']
-            new_note['Jlab-DictionaryLookup'] = ''
-            new_note['Jlab-Metadata'] = ''
-            new_note['Jlab-Remarks'] = ''
-            new_note['Other-Front'] = new_note["Jlab-KanjiCloze"]
-            # surprise, jlab is not needed.. (wasted a lot of hours on this). Jlab needs only the hiragana cloze and kanji matching each other
-            # shown roumaji are converted by them and displayed
-            new_note['Jlab-ListeningFront'] = re.sub(multi_space_pattern, ' ', " ".join(''.join(e for e in word["hepburn"] if e.isalnum() or e in ['[',']']) for word in kakasi_conv).replace("]", " ]"))
-            new_note['Jlab-ListeningBack'] = new_note['Jlab-ListeningFront']
-            new_note['Jlab-ClozeFront'] = new_note['Jlab-ListeningFront']
-            new_note['Jlab-ClozeBack'] = new_note['Jlab-ListeningFront']
-
-        cur_note_list.append(new_note)
-
-    return cur_note_list
+            self._lemma = dictionary[0][0]['headword']
+
+        self._notes: dict[int, dict] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._cards)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._note(i) for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        return self._note(idx)
+
+    def _note(self, idx: int) -> dict:
+        with self._lock:
+            if idx not in self._notes:
+                card, media_base_path = self._cards[idx]
+                self._notes[idx] = format_note(card, media_base_path, self._lemma)
+            return self._notes[idx]
+
+    def adopt(self, other: 'PagedNotes') -> None:
+        """
+        Takes over the notes other already built from the same examples, e.g. the first page shown while streaming,
+        so the notes on screen stay the ones that get imported.
+        """
+        if other._lemma != self._lemma:
+            return
+        with other._lock:
+            built = dict(other._notes)
+        with self._lock:
+            for idx, note in built.items():
+                if idx < len(self._cards) and self._cards[idx][0] is other._cards[idx][0] \
+                        and self._cards[idx][1] == other._cards[idx][1]:
+                    self._notes.setdefault(idx, note)
+
+    def materialize(self, start: int, end: int) -> None:
+        """Builds the notes in [start:end], e.g. to prefetch the next page in the background."""
+        self[start:end]
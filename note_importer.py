@@ -1,21 +1,41 @@
 # Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
 # License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
 
-from collections.abc import Iterable
+import functools
+import itertools
+import shutil
+import tempfile
+import threading
+import time
+from collections.abc import Callable, Iterable, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from enum import Enum, auto
-from typing import NamedTuple
-from urllib import request, parse
+from typing import NamedTuple, Optional
+from urllib import parse, error
 
+from anki.collection import OpChanges
 from anki.models import NoteType
 from anki.notes import Note
-from anki.utils import join_fields
+from anki.utils import join_fields, split_fields, strip_html_media
 from aqt import gui_hooks
 from aqt import mw
 from aqt.qt import *
-from aqt.utils import showInfo, show_info
+from aqt.utils import showInfo, show_info, tooltip
 
-from .common import NameId
+from .common import NameId, LogDebug
 from .config import config
+from . import http_client
+from .media_cache import cache as media_cache
+from .note_getter import BASE_FIELD_NAMES, JLAB_FIELD_NAMES, LazyNote
+from .id_index import id_index
+
+try:
+    from anki.collection import AddNoteRequest
+except ImportError:
+    # anki before 23.10 can only add one note at a time
+    AddNoteRequest = None
+
+logDebug = LogDebug()
 
 
 class ImportResult(Enum):
@@ -39,23 +59,100 @@ def files_in_note(note: Note) -> Iterable[FileInfo]:
             yield FileInfo(file_ref, file_path)
 
 
+def media_file_path(url: str) -> str:
+    return os.path.join(mw.col.media.dir(), url.split('/')[-1])
+
+
+def fetch_media_file(url: str) -> None:
+    """
+    Streams url into a temporary file in the media folder and renames it once complete,
+    so an interrupted download never leaves a truncated file behind. Raises IOError on failure.
+    Files the previewer already cached are copied instead of downloaded again.
+    """
+    target = media_file_path(url)
+    cached = media_cache.cached_path(url)
+    with open(cached, 'rb') if cached else http_client.client.open(parse.quote(url, safe=':/%')) as src:
+        tmp = tempfile.NamedTemporaryFile(dir=os.path.dirname(target), prefix='.subsearch_', suffix='.part', delete=False)
+        try:
+            with tmp:
+                shutil.copyfileobj(src, tmp, config['media_buffer_size'])
+                tmp.flush()
+                os.fsync(tmp.fileno())
+            # keep the exact name, the note's fields reference it
+            os.replace(tmp.name, target)
+        except BaseException:
+            os.remove(tmp.name)
+            raise
+    if cached:
+        logDebug(f'Copied {url} from the media cache')
+
+
 def download_media_files(fetched_note: dict) -> bool:
     print(fetched_note['needed_media'])
     for url in fetched_note['needed_media']:
+        if os.path.exists(media_file_path(url)):
+            show_info(url.split('.')[-1] + " already exists. Please make sure it is correct")
+            continue
+
         try:
-            content = request.urlopen(parse.quote(url, safe=':/%'))
-        except IOError:
+            fetch_media_file(url)
+        except http_client.TRANSFER_ERRORS:
             showInfo("You need an active internet connection to import a card.")
             return False
 
-        if os.path.exists(os.path.join(mw.col.media.dir(), url.split('/')[-1])):
-            show_info(url.split('.')[-1] + " already exists. Please make sure it is correct")
-        else: 
-            open(os.path.join(mw.col.media.dir(), url.split('/')[-1]), 'b+w').write(content.read())
-
     return True
 
 
+def _fetch_with_retries(url: str) -> None:
+    retries = config['media_download_retries']
+    for attempt in range(retries + 1):
+        try:
+            return fetch_media_file(url)
+        except error.URLError:
+            # the client already retried error statuses and failed connections
+            raise
+        except http_client.TRANSFER_ERRORS:
+            # broke off while downloading
+            if attempt == retries:
+                raise
+        time.sleep(http_client.backoff_delay(attempt))
+
+
+def _report_download_progress(done: int, total: int) -> None:
+    mw.taskman.run_on_main(
+        lambda: mw.progress.update(label=f"Downloading media... {done}/{total}", value=done, max=total)
+    )
+
+
+def download_media_batch(notes: Sequence[dict]) -> set[str]:
+    """
+    Downloads the media of all notes in parallel, every distinct url only once.
+    Returns the urls that couldn't be downloaded.
+    """
+    urls = [
+        url
+        for url in dict.fromkeys(url for note in notes for url in note['needed_media'])
+        if not os.path.exists(media_file_path(url))
+    ]
+    if not urls:
+        return set()
+
+    logDebug(f'Downloading {len(urls)} media files')
+    failed = set()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, config['media_download_workers'])) as executor:
+        futures = {executor.submit(_fetch_with_retries, url): url for url in urls}
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                future.result()
+            except http_client.TRANSFER_ERRORS as err:
+                logDebug(f'Failed to download {futures[future]}: {err}')
+                failed.add(futures[future])
+            _report_download_progress(done, len(urls))
+    logDebug(f'Downloaded {len(urls) - len(failed)}/{len(urls)} media files in {time.perf_counter() - start:.2f} s')
+    return failed
+
+
 def remove_media_files(new_note: Note):
     """
     If the user pressed the Edit button, but then canceled the import operation,
@@ -70,27 +167,228 @@ def remove_media_files(new_note: Note):
     ])
 
 
+class ModelSignatureCache:
+    """
+    Maps the sorted field names of every note type to its id, so finding a note type
+    with the fields of a note is a dict lookup. Built on first use and dropped once
+    a note type is added, removed or edited.
+    """
+
+    def __init__(self):
+        self._by_signature: Optional[dict[tuple[str, ...], int]] = None
+        self._fingerprint: Optional[list] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _notetypes_fingerprint() -> list:
+        # editing a note type, e.g. its fields, updates its modification time
+        return mw.col.db.all('select id, mtime_secs from notetypes order by id')
+
+    @staticmethod
+    def signature(field_names: Iterable[str]) -> tuple[str, ...]:
+        return tuple(sorted(field_names))
+
+    def _build(self) -> dict[tuple[str, ...], int]:
+        if self._by_signature is None:
+            self._fingerprint = self._notetypes_fingerprint()
+            self._by_signature = {}
+            for model in mw.col.models.all():
+                # the first note type with these fields wins, like the linear search before
+                self._by_signature.setdefault(self.signature(mw.col.models.field_names(model)), model['id'])
+            logDebug(f'Indexed fields of {len(self._by_signature)} note types')
+        return self._by_signature
+
+    def lookup(self, field_names: Iterable[str]) -> Optional[NoteType]:
+        with self._lock:
+            model_id = self._build().get(self.signature(field_names))
+        return mw.col.models.get(model_id) if model_id is not None else None
+
+    def register(self, model: NoteType) -> None:
+        """Adds a note type the add-on created itself."""
+        with self._lock:
+            self._build().setdefault(self.signature(mw.col.models.field_names(model)), model['id'])
+            self._fingerprint = self._notetypes_fingerprint()
+
+    def refresh(self) -> None:
+        """Drops the cache if note types were changed by someone else."""
+        with self._lock:
+            if self._by_signature is not None and self._notetypes_fingerprint() != self._fingerprint:
+                self._by_signature = None
+
+    def invalidate(self, *_args) -> None:
+        with self._lock:
+            self._by_signature = None
+
+
+model_cache = ModelSignatureCache()
+gui_hooks.profile_did_open.append(model_cache.invalidate)
+
+
+@functools.cache
+def _subsearch_signatures() -> frozenset[tuple[str, ...]]:
+    """Signatures of the note types the add-on creates, for every combination of the optional fields."""
+    optional = [('Image',), ('source_info',), JLAB_FIELD_NAMES]
+    return frozenset(
+        ModelSignatureCache.signature([*BASE_FIELD_NAMES, *(name for group in groups for name in group)])
+        for count in range(len(optional) + 1) for groups in itertools.combinations(optional, count)
+    )
+
+
+def is_subsearch_model(model: NoteType) -> bool:
+    """Whether the note type has the fields of one the add-on creates, matched like get_matching_model does."""
+    return ModelSignatureCache.signature(mw.col.models.field_names(model)) in _subsearch_signatures()
+
+
+class DupeIndex:
+    """
+    HTML-stripped first fields of all notes per note type, the values Note.dupeOrEmpty() compares.
+    Each note type is read with one query on first use and kept up to date as notes are added.
+    The note count and newest modification of each note type tell whether others changed its notes.
+    """
+
+    def __init__(self):
+        self._by_mid: dict[int, set[str]] = {}
+        self._fingerprints: dict[int, tuple[int, int]] = {}
+        self._loading: dict[int, list[Callable[[], None]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _fingerprint(mid: int) -> tuple[int, int]:
+        return tuple(mw.col.db.first('select count(), coalesce(max(mod), 0) from notes where mid = ?', mid))
+
+    def _first_fields(self, mid: int) -> set[str]:
+        if mid not in self._by_mid:
+            self._fingerprints[mid] = self._fingerprint(mid)
+            self._by_mid[mid] = {
+                strip_html_media(split_fields(flds)[0])
+                for flds in mw.col.db.list('select flds from notes where mid = ?', mid)
+            }
+            logDebug(f'Indexed first fields of {len(self._by_mid[mid])} notes of note type {mid}')
+        return self._by_mid[mid]
+
+    def contains(self, mid: int, first_field: str) -> bool:
+        with self._lock:
+            return strip_html_media(first_field) in self._first_fields(mid)
+
+    def is_loaded(self, mid: int) -> bool:
+        return mid in self._by_mid
+
+    def load_in_background(self, mid: int, on_loaded: Callable[[], None]) -> None:
+        """Reads the notes of a note type off the main thread and calls on_loaded on it afterwards."""
+        if mid in self._loading:
+            self._loading[mid].append(on_loaded)
+            return
+        self._loading[mid] = [on_loaded]
+
+        def load():
+            with self._lock:
+                self._first_fields(mid)
+
+        def on_done(future):
+            callbacks = self._loading.pop(mid, [])
+            if future.exception() is not None:
+                logDebug(f'Unable to index note type {mid}: {future.exception()}')
+                return
+            for callback in callbacks:
+                callback()
+
+        mw.taskman.run_in_background(load, on_done)
+
+    def add(self, new_note: Note) -> None:
+        with self._lock:
+            if new_note.mid in self._by_mid:
+                self._by_mid[new_note.mid].add(strip_html_media(new_note.fields[0]))
+
+    def sync(self, mids: Iterable[int]) -> None:
+        """Takes note of the add-on's own changes to these note types, once their new notes were added."""
+        with self._lock:
+            for mid in set(mids).intersection(self._by_mid):
+                self._fingerprints[mid] = self._fingerprint(mid)
+
+    def refresh(self) -> None:
+        """Drops the note types whose notes were changed by someone else."""
+        with self._lock:
+            for mid in [mid for mid in self._by_mid if self._fingerprint(mid) != self._fingerprints.get(mid)]:
+                del self._by_mid[mid]
+                logDebug(f'Notes of note type {mid} changed, dropped them from the dupe index')
+
+    def invalidate(self, *_args) -> None:
+        with self._lock:
+            self._by_mid.clear()
+            self._fingerprints.clear()
+
+
+def _is_legacy_reset(changes: OpChanges, handler: Optional[object]) -> bool:
+    """Whether changes were made up by mw.reset(), which reports every kind of change."""
+    return handler is None and all(
+        getattr(changes, field.name) for field in changes.DESCRIPTOR.fields if field.name != 'kind'
+    )
+
+
+def _on_operation_did_execute(changes: OpChanges, handler: Optional[object]) -> None:
+    if _is_legacy_reset(changes, handler):
+        # every import ends with one, only check whether anything else changed
+        model_cache.refresh()
+        dupe_index.refresh()
+        return
+    if changes.notetype:
+        model_cache.invalidate()
+    if changes.note or changes.notetype:
+        dupe_index.invalidate()
+
+
+dupe_index = DupeIndex()
+gui_hooks.operation_did_execute.append(_on_operation_did_execute)
+gui_hooks.add_cards_did_add_note.append(dupe_index.add)
+gui_hooks.profile_did_open.append(dupe_index.invalidate)
+
+
+def _note_field_names(note: dict) -> list[str]:
+    """Field names of a fetched note that are imported into anki."""
+    # lazy notes know their field names without building the lazy fields
+    note_keys = note.field_names() if isinstance(note, LazyNote) else list(note.keys())
+
+    # remove keys important for backend or unwanted
+    note_keys.remove('needed_media')
+    if not config['import_source_info']:
+        note_keys.remove('source_info')
+    return note_keys
+
+
+def find_matching_model(model_id: int, note: dict) -> Optional[NoteType]:
+    """Like get_matching_model, but returns None instead of creating a note type."""
+    if model_id != NameId.none_type().id:
+        return mw.col.models.get(model_id)
+    return model_cache.lookup(_note_field_names(note))
+
+
+def is_in_collection(model_id: int, note: dict, *, on_loaded: Optional[Callable[[], None]] = None) -> bool:
+    """
+    Whether importing note with this note type would be skipped as duplicate.
+    With on_loaded, the notes of the note type aren't read on the calling thread: until they are,
+    False is returned, and on_loaded is called on the main thread once they are read.
+    """
+    if model_id is None or (model := find_matching_model(model_id, note)) is None:
+        return False
+    first_field = str(note.get(model['flds'][0]['name'], ''))
+    if not first_field.strip():
+        return False
+    if on_loaded is not None and not dupe_index.is_loaded(model['id']):
+        dupe_index.load_in_background(model['id'], on_loaded)
+        return False
+    return dupe_index.contains(model['id'], first_field)
+
+
 def get_matching_model(model_id: int, note: dict) -> NoteType:
     if model_id != NameId.none_type().id:
         # use existing note type (even if its name or fields are different)
         return mw.col.models.get(model_id)
     else:
         # find a model which has the required fields, else create a new one
-        models = mw.col.models.all()
-
-        # remove keys important for backend or unwanted
-        note_keys = list(note.keys())
-        note_keys.remove('needed_media')
-        if not config['import_source_info']:
-            note_keys.remove('source_info')
-
-        matching_model = None
+        note_keys = _note_field_names(note)
 
         # match for field names, regardless of order
-        for model in models:
-            if sorted(mw.col.models.field_names(model)) == sorted(note_keys):
-                matching_model = model
-                break
+        matching_model = model_cache.lookup(note_keys)
 
         if not matching_model:
             # create new model with Jlab template
@@ -138,21 +436,48 @@ def get_matching_model(model_id: int, note: dict) -> NoteType:
             mw.col.models.add_template(matching_model, mm_template)
             matching_model['id'] = 0
 
-            mw.col.models.add_dict(matching_model)
+            # add_dict doesn't write the new id back into the dict
+            matching_model = mw.col.models.get(mw.col.models.add_dict(matching_model).id)
+            # make it known right away, so the rest of a batch doesn't create another one
+            model_cache.register(matching_model)
         return matching_model
 
 
-def import_note(model_id: int, note: dict, deck_id: int) -> ImportResult:
-    matching_model = get_matching_model(model_id, note)
-    new_note = Note(mw.col, matching_model)
-    new_note.note_type()['did'] = deck_id
-    
+def _make_note(model: NoteType, note: dict) -> Note:
+    new_note = Note(mw.col, model)
+
     for key in new_note.keys():
         if key != 'source_info' or config['import_source_info']:
             try:
                 new_note[key] = note[key]
             except KeyError:
                 pass
+    return new_note
+
+
+def _call_add_cards_hook(new_note: Note) -> None:
+    if config['call_add_cards_hook']:
+        gui_hooks.add_cards_did_add_note(new_note)
+
+
+def find_dupes(new_notes: Sequence[Note]) -> list[bool]:
+    """
+    Same as Note.dupeOrEmpty() for every note, but looked up in the dupe index.
+    A note repeating an earlier note of the batch counts as duplicate as well.
+    """
+    seen: set[tuple[int, str]] = set()
+    dupes = []
+    for new_note in new_notes:
+        first_field = strip_html_media(new_note.fields[0])
+        key = (new_note.mid, first_field)
+        dupes.append(not first_field.strip() or key in seen or dupe_index.contains(new_note.mid, first_field))
+        seen.add(key)
+    return dupes
+
+
+def import_note(model_id: int, note: dict, deck_id: int) -> ImportResult:
+    new_note = _make_note(get_matching_model(model_id, note), note)
+    new_note.note_type()['did'] = deck_id
 
     # check if note is dupe of existing one
     if config['skip_duplicates'] and new_note.dupeOrEmpty():
@@ -160,10 +485,90 @@ def import_note(model_id: int, note: dict, deck_id: int) -> ImportResult:
 
     if not download_media_files(note):
         return ImportResult.fail
-    
+
     mw.col.addNote(new_note)  # new_note has changed its id
+    dupe_index.add(new_note)
+    dupe_index.sync([new_note.mid])
+    id_index.add_note(new_note)
+    _call_add_cards_hook(new_note)
+    return ImportResult.success
 
-    if config['call_add_cards_hook']:
-        gui_hooks.add_cards_did_add_note(new_note)
 
-    return ImportResult.success
+def _add_notes(notes: list[Note], deck_id: int) -> int:
+    """
+    Adds notes to the collection in a single undoable operation and returns how many were added.
+    Before anki 23.10 they are added one at a time on the main thread, so that no change started from the ui
+    slips into their undo entry; if one of them fails, the ones before it stay added.
+    """
+    if AddNoteRequest is not None:
+        mw.col.add_notes([AddNoteRequest(note=note, deck_id=deck_id) for note in notes])
+        return len(notes)
+    if threading.current_thread() is not threading.main_thread():
+        future = Future()
+
+        def add_on_main():
+            try:
+                future.set_result(_add_notes(notes, deck_id))
+            except BaseException as err:
+                future.set_exception(err)
+
+        mw.taskman.run_on_main(add_on_main)
+        return future.result()
+
+    undo_entry = mw.col.add_custom_undo_entry(f'Import {len(notes)} Notes')
+    added = 0
+    try:
+        for note in notes:
+            mw.col.add_note(note, deck_id)
+            added += 1
+    except Exception as err:
+        logDebug(f'Adding notes stopped after {added} of {len(notes)}: {err}')
+    finally:
+        mw.col.merge_undo_entries(undo_entry)
+    return added
+
+
+def import_notes(model_id: int, notes: Sequence[dict], deck_id: int) -> list[ImportResult]:
+    """
+    Imports several notes at once. The note type is resolved once per set of fields,
+    duplicates are checked with one query, media of the remaining notes is downloaded in parallel
+    and all notes are added in a single undoable collection operation.
+    """
+    models: dict[tuple[str, ...], NoteType] = {}
+    new_notes = []
+    for note in notes:
+        signature = tuple(sorted(note.keys()))
+        if signature not in models:
+            models[signature] = get_matching_model(model_id, note)
+        new_notes.append(_make_note(models[signature], note))
+
+    results: list[ImportResult] = [ImportResult.fail] * len(notes)
+    dupes = find_dupes(new_notes) if config['skip_duplicates'] else [False] * len(notes)
+    pending: list[int] = []
+    for idx, is_dupe in enumerate(dupes):
+        if is_dupe:
+            results[idx] = ImportResult.dupe
+        else:
+            pending.append(idx)
+
+    failed_urls = download_media_batch([notes[idx] for idx in pending])
+    if failed_urls:
+        mw.taskman.run_on_main(lambda: tooltip(f"{len(failed_urls)} media files couldn't be downloaded."))
+
+    to_add = [idx for idx in pending if not failed_urls.intersection(notes[idx]['needed_media'])]
+    if to_add:
+        start = time.perf_counter()
+        added = _add_notes([new_notes[idx] for idx in to_add], deck_id)
+        logDebug(f'Added {added} notes in {(time.perf_counter() - start) * 1000:.1f} ms')
+        if added < len(to_add):
+            # the remaining notes stay marked as failed
+            message = f"Only {added} of {len(to_add)} notes could be added."
+            mw.taskman.run_on_main(lambda: tooltip(message))
+            to_add = to_add[:added]
+    for idx in to_add:
+        dupe_index.add(new_notes[idx])
+        id_index.add_note(new_notes[idx])
+        _call_add_cards_hook(new_notes[idx])
+        results[idx] = ImportResult.success
+    dupe_index.sync(new_notes[idx].mid for idx in to_add)
+    return results
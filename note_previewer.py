@@ -2,7 +2,10 @@
 # License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
 
 import base64
+import functools
+import json
 import os.path
+from collections import OrderedDict
 from typing import Optional
 from urllib.parse import quote
 import re
@@ -14,6 +17,7 @@ from aqt.webview import AnkiWebView
 
 from .subsearch_ajt.media import find_sound, find_image
 from .common import LogDebug
+from .media_cache import cache as media_cache
 
 logDebug = LogDebug()
 
@@ -21,6 +25,7 @@ WEB_DIR = os.path.join(os.path.dirname(__file__), 'web')
 HTTP_REGEX = re.compile(r"(?i)\b((?:https?://|www\d{0,3}[.]|[a-z0-9.\-]+[.][a-z]{2,4}/)(?:[^\s()<>]+|\(([^\s()<>]+|(\([^\s()<>]+\)))*\))+(?:\(([^\s()<>]+|(\([^\s()<>]+\)))*\)|[^\s`!()\[\]{};:'\".,<>?«»“”‘’]))")
 
 
+@functools.cache
 def get_previewer_html() -> str:
     with open(os.path.join(WEB_DIR, 'previewer.html'), encoding='utf8') as f:
         return f.read()
@@ -34,15 +39,37 @@ def filetype(file: str):
     return os.path.splitext(file)[-1]
 
 
+def media_src(url: str) -> str:
+    """
+    Returns the cached file of url as served by anki's media server, or the quoted url itself if it isn't cached yet.
+    The webview loads the file itself, so neither the markup cache nor eval carry its contents.
+    While url is being prefetched it returns an empty src, the previewer shows the note again once that is over.
+    """
+    if (path := media_cache.cached_path(url)) is not None:
+        relpath = os.path.relpath(path, os.path.dirname(__file__)).replace(os.sep, '/')
+        return f"/_addons/{mw.addonManager.addonFromModule(__name__)}/{quote(relpath)}"
+    if media_cache.is_pending(url):
+        return ''
+    return quote(url, safe=":/%")
+
+
 class NotePreviewer(AnkiWebView):
     """Previews a note in a Form Layout using a webview."""
     _css_relpath = f"/_addons/{mw.addonManager.addonFromModule(__name__)}/web/previewer.css"
 
-    mw.addonManager.setWebExports(__name__, r"(img|web)/.*\.(js|css|html|png|svg)")
+    mw.addonManager.setWebExports(__name__, r"(img|web)/.*\.(js|css|html|png|svg)|user_files/media_cache/[0-9a-f]{40}(\.\w+)?")
+
+    _markup_cache_size = 256
+    # emitted from the prefetch threads; queued so it also runs after load_note when emitted from the main thread
+    _media_fetched = pyqtSignal(str)
 
     def __init__(self, parent: QWidget):
         super().__init__(parent)
+        self._note: Optional[dict] = None
+        self._media_fetched.connect(self._on_media_fetched, Qt.ConnectionType.QueuedConnection)
         self._note_media_dir: Optional[str] = None
+        self._page_loaded = False
+        self._markup_cache: OrderedDict[str, str] = OrderedDict()
         self.set_title("Note previewer")
         self.disable_zoom()
         self.setProperty("url", QUrl("about:blank"))
@@ -51,6 +78,41 @@ class NotePreviewer(AnkiWebView):
         self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
 
     def load_note(self, note: dict):
+        self._note = note
+        # registered before building the markup, so a download finishing in between still shows the note again
+        for url in note['needed_media']:
+            media_cache.when_fetched(url, self._media_fetched.emit)
+        markup = self._note_markup(note)
+        if self._page_loaded:
+            # only swap the content, reloading the page would load the css again
+            self.eval(f"document.querySelector('main').innerHTML = {json.dumps(markup)};")
+        else:
+            self.stdHtml(
+                get_previewer_html().replace('<!--CONTENT-->', markup),
+                js=[],
+                css=[self._css_relpath, ]
+            )
+            self._page_loaded = True
+
+    def _on_media_fetched(self, url: str):
+        if self._note is not None and url in self._note['needed_media'] and not self.isHidden():
+            self.load_note(self._note)
+
+    def _media_state(self, url: str) -> str:
+        if media_cache.cached_path(url):
+            return '1'
+        return 'p' if media_cache.is_pending(url) else '0'
+
+    def _note_markup(self, note: dict) -> str:
+        """Returns the rows of a note, remembered per note ID and the state of each of its media files."""
+        key = str(note.get('ID', ''))
+        if key:
+            # rows built before the media was cached point at the remote files or at nothing while it downloads
+            key += ''.join(self._media_state(url) for url in note['needed_media'])
+        if key and (markup := self._markup_cache.get(key)) is not None:
+            self._markup_cache.move_to_end(key)
+            return markup
+
         rows: list[str] = []
         for field_name, field_content in note.items():
             if field_name not in ['needed_media']:
@@ -59,11 +121,12 @@ class NotePreviewer(AnkiWebView):
                     '<div class="content">'+
                     self._create_html_row_for_field(field_content, note)+'</div>'
                 )
-        self.stdHtml(
-            get_previewer_html().replace('<!--CONTENT-->', ''.join(rows)),
-            js=[],
-            css=[self._css_relpath, ]
-        )
+        markup = ''.join(rows)
+        if key:
+            self._markup_cache[key] = markup
+            if len(self._markup_cache) > self._markup_cache_size:
+                self._markup_cache.popitem(last=False)
+        return markup
 
     def _create_html_row_for_field(self, field_content: str, note) -> str:
         """Creates a row for the previewer showing the current note's field."""
@@ -75,14 +138,14 @@ class NotePreviewer(AnkiWebView):
         if audio_name := find_sound(field_content):
             print(note['needed_media'])
             markup.append(f"""<div class="subsearch__audio_list">
-    <audio preload="auto" id="subsearch_{quote(audio_name, safe=":/%")}_player" src="{quote(audio_name if len(note['needed_media']) == 0 else note['needed_media'][0], safe=":/%")}"></audio>
+    <audio preload="auto" id="subsearch_{quote(audio_name, safe=":/%")}_player" src="{quote(audio_name, safe=":/%") if len(note['needed_media']) == 0 else media_src(note['needed_media'][0])}"></audio>
     <button class="subsearch__play_button" title="Play-Button for {audio_name}" onclick="(audio=document.getElementById('subsearch_{quote(audio_name, safe=":/%")}_player')).paused ? audio.play() : (audio.currentTime = 0)"></button>
 </div>
 """)
             logDebug("Audio added, "+audio_name+('' if len(note["needed_media"]) == 0 else ", URL "+quote(note["needed_media"][0], safe=":/%")))
 
         elif image_name := find_image(field_content):
-            if re.findall(HTTP_REGEX, image_name):
+            if HTTP_REGEX.search(image_name):
                 markup.append(f'<div class="subsearch__image_list">'
                               f'<img alt="image:{image_name}" '
                               f'src="{image_name}"/></div>')
@@ -90,7 +153,7 @@ class NotePreviewer(AnkiWebView):
             else:
                 markup.append(f'<div class="subsearch__image_list">'
                               f'<img alt="image:{image_name}" '
-                              f'src="{quote(note["needed_media"][1], safe=":/%")}"/></div>')
+                              f'src="{media_src(note["needed_media"][1])}"/></div>')
                 logDebug("Image added, "+image_name+", URL "+quote(note["needed_media"][1], safe=":/%"))
 
         elif text := html_to_text_line(field_content):  # use elif to not add image or audio caption
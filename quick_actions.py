@@ -9,20 +9,16 @@ from aqt.qt import QAction, qconnect, QKeySequence
 from aqt.utils import tooltip, showInfo
 from aqt.operations import QueryOp
 
-from . import note_getter
-from .note_importer import import_note, ImportResult
-from .common import LogDebug, NameId
+from .common import LogDebug, NameId, sanitize_term
 
 logDebug = LogDebug()
 
-import re
-
 
 def _window_state_path() -> str:
     return path.join(path.dirname(__file__), 'user_files', 'window_state.json')
 
 
-def _load_profile_state() -> dict:
+def load_profile_state() -> dict:
     try:
         with open(_window_state_path(), encoding='utf8') as f:
             data = json.load(f)
@@ -53,7 +49,7 @@ def _resolve_model_id(model_name: Optional[str]) -> int:
         return NameId.none_type().id
 
 
-def _filters_from_state(state: dict) -> list:
+def filters_from_state(state: dict) -> list:
     # extended_filters = [category, sort, [min,max], jlpt, wanikani, exact]
     return [
         state.get('category', '--'),
@@ -75,45 +71,24 @@ def _selected_text_from_web(web) -> str:
             return ''
 
 
-def _sanitize_term(term: str) -> str:
-    """Remove bracketed readings like （おお） and similar pairs, then trim.
-    Supports both ASCII and fullwidth brackets common in JP text.
-    """
-    if not term:
-        return ''
-    s = term
-    patterns = [
-        r"\([^)]*\)",           # ( ... )
-        r"（[^）]*）",             # （ ... ）
-        r"\[[^\]]*\]",         # [ ... ]
-        r"【[^】]*】",             # 【 ... 】
-        r"〈[^〉]*〉",             # 〈 ... 〉
-        r"《[^》]*》",             # 《 ... 《
-        r"「[^」]*」",             # 「 ... 」
-        r"『[^』]*』",             # 『 ... 』
-    ]
-    for pat in patterns:
-        s = re.sub(pat, '', s)
-    s = re.sub(r"\s+", " ", s).strip()
-    return s
-
 def _open_search_with_term(term: str):
-    d = getattr(mw, '_ani_main_dialog', None)
-    if not d:
-        from .search_window import MainDialog
-        d = mw._ani_main_dialog = MainDialog(parent=mw)
-    d.open_with_term(term, auto_search=True)
+    from .bootstrap import main_dialog
+    main_dialog().open_with_term(term, auto_search=True)
 
 
 def _quick_import_first(term: str):
-    term = _sanitize_term((term or '').strip())
+    # imported here to keep them out of anki's start-up
+    from . import note_getter
+    from .note_importer import import_note, ImportResult
+
+    term = sanitize_term((term or '').strip())
     if not term:
         return tooltip('No text selected.')
 
-    state = _load_profile_state()
+    state = load_profile_state()
     deck_id = _resolve_deck_id(state.get('to_deck'))
     model_id = _resolve_model_id(state.get('note_type'))
-    filters = _filters_from_state(state)
+    filters = filters_from_state(state)
 
     def _op(_c):
         return note_getter.get_for("https://apiv2.immersionkit.com/search", term, extended_filters=filters)
@@ -152,7 +127,7 @@ def init():
             pass
 
         text = _selected_text_from_web(web)
-        stext = _sanitize_term(text)
+        stext = sanitize_term(text)
         if not stext:
             return
 
@@ -173,7 +148,7 @@ def init():
         if not web:
             return tooltip('Not in Reviewer.')
         text = _selected_text_from_web(web)
-        stext = _sanitize_term(text)
+        stext = sanitize_term(text)
         if not stext:
             return tooltip('No text selected.')
         _open_search_with_term(stext)
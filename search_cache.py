@@ -0,0 +1,121 @@
+# Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
+
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Optional
+
+from aqt import gui_hooks
+
+from .common import LogDebug
+from .config import config
+
+logDebug = LogDebug()
+
+CACHE_PATH = os.path.join(os.path.dirname(__file__), 'user_files', 'search_cache.sqlite')
+
+
+class SearchCache:
+    """
+    Persistent cache of raw Immersion Kit search responses.
+    Entries expire after ttl seconds, and the least recently used ones are evicted
+    once the compressed payloads exceed max_bytes.
+    """
+
+    def __init__(self, path: str, *, ttl: float, max_bytes: int):
+        self._path = path
+        self._ttl = ttl
+        self._max_bytes = max_bytes
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._ttl > 0 and self._max_bytes > 0
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            self._db = sqlite3.connect(self._path, check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, payload BLOB NOT NULL, size INTEGER NOT NULL, '
+                'created REAL NOT NULL, accessed REAL NOT NULL)'
+            )
+            self._db.commit()
+        return self._db
+
+    def get(self, key: str) -> Optional[bytes]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            row = db.execute('SELECT payload, created FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None or now - row[1] > self._ttl:
+                if row is not None:
+                    db.execute('DELETE FROM responses WHERE key = ?', (key,))
+                    db.commit()
+                self.misses += 1
+                logDebug(f'Search cache miss ({self.hits} hits, {self.misses} misses)')
+                return None
+            db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (now, key))
+            db.commit()
+            self.hits += 1
+        logDebug(f'Search cache hit ({self.hits} hits, {self.misses} misses)')
+        return zlib.decompress(row[0])
+
+    def peek(self, key: str) -> Optional[bytes]:
+        """Like get, but neither counts as a hit or miss nor marks the entry as used."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._conn().execute('SELECT payload, created FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None or time.time() - row[1] > self._ttl:
+            return None
+        return zlib.decompress(row[0])
+
+    def put(self, key: str, payload: bytes) -> None:
+        if not self.enabled:
+            return
+        compressed = zlib.compress(payload)
+        now = time.time()
+        with self._lock:
+            db = self._conn()
+            db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                       (key, compressed, len(compressed), now, now))
+            self._evict(db)
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        db.execute('DELETE FROM responses WHERE created < ?', (time.time() - self._ttl,))
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self._max_bytes:
+            return
+        evicted = 0
+        for key, size in db.execute('SELECT key, size FROM responses ORDER BY accessed').fetchall():
+            if total <= self._max_bytes:
+                break
+            db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            evicted += 1
+        logDebug(f'Evicted {evicted} entries from the search cache')
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+cache = SearchCache(
+    CACHE_PATH,
+    ttl=config['search_cache_ttl_hours'] * 3600,
+    max_bytes=config['search_cache_max_mb'] * 1024 * 1024,
+)
+gui_hooks.profile_will_close.append(cache.close)
@@ -22,6 +22,8 @@
 
 import json
 from collections import defaultdict
+from collections.abc import Sequence
+from typing import Optional
 from os import path, mkdir
 from math import ceil
 
@@ -33,9 +35,9 @@ from aqt.operations import QueryOp
 
 from .config import config
 from .common import ADDON_NAME, LogDebug, add_kakasi, sorted_decks_and_ids, NameId
-from .subsearch_ajt.about_menu import menu_root_entry
 from .subsearch_ajt.consts import SOURCE_LINK
-from .note_importer import import_note, ImportResult
+from .note_importer import import_notes, is_in_collection, ImportResult
+from .id_index import id_index
 from .widgets import SearchResultLabel, DeckCombo, ComboBox, SpinBox, StatusBar, NoteList, ItemBox, WIDGET_HEIGHT
 from .edit_window import AddDialogLauncher
 from . import note_getter
@@ -63,6 +65,7 @@ class MainDialogUI(QDialog):
         self.filter_collapse = QPushButton('🞁')
         self.search_term_edit = QLineEdit()
         self.search_button = QPushButton('Search')
+        self.batch_button = QPushButton('Batch...')
         if config['show_help_buttons']:
             self.help_button = QPushButton('Help')
         self.page_prev = QPushButton('🞀')
@@ -86,6 +89,8 @@ class MainDialogUI(QDialog):
         filter_row.addWidget(self.search_term_edit)
         self.search_button.setDefault(True)
         filter_row.addWidget(self.search_button)
+        self.batch_button.setToolTip("Search a list of terms at once")
+        filter_row.addWidget(self.batch_button)
         if config['show_help_buttons']:
             filter_row.addWidget(self.help_button)
         return filter_row
@@ -157,6 +162,7 @@ class MainDialogUI(QDialog):
                        self.import_button,
                        self.filter_collapse,
                        self.search_button,
+                       self.batch_button,
                        self.search_term_edit]
         if config['show_help_buttons']:
             all_widgets.append(self.help_button)
@@ -259,6 +265,12 @@ class MainDialog(MainDialogUI):
         self.window_state = WindowState(self)
         self._add_window_mgr = AddDialogLauncher(self)
         self.search_block = False
+        # None if no search waits, else whether the waiting one is incremental
+        self._queued_search: Optional[bool] = None
+        self._search_generation = 0
+        self._search_debounce = QTimer(self)
+        self._search_debounce.setSingleShot(True)
+        self._search_debounce.setInterval(config['search_debounce_ms'])
         self.page = 0
         self.connect_elements()
         disable_help_button(self)
@@ -267,7 +279,10 @@ class MainDialog(MainDialogUI):
         qconnect(self.edit_button.clicked, self.new_edit_win)
         qconnect(self.import_button.clicked, self.start_import)
         qconnect(self.search_button.clicked, self.update_notes_list)
+        qconnect(self.batch_button.clicked, self.open_batch_search)
         qconnect(self.search_term_edit.editingFinished, self.update_notes_list)
+        qconnect(self.search_term_edit.textEdited, self._on_search_text_edited)
+        qconnect(self._search_debounce.timeout, lambda: self.update_notes_list(incremental=True))
         qconnect(self.filter_collapse.clicked, self.toggle_filter_rows)
         if config['show_help_buttons']:
             qconnect(self.help_button.clicked, lambda: openLink(
@@ -276,6 +291,8 @@ class MainDialog(MainDialogUI):
         qconnect(self.page_skip.clicked, lambda: self.change_page())
         qconnect(self.note_type_selection_combo.currentTextChanged,
                  self.update_note_fields)
+        # imports from here, the batch search or the miner end with mw.reset() and change the badges
+        gui_hooks.state_did_reset.append(self.note_list.refresh_badges)
 
     def show(self):
         if config["jlab_format"] and not path.exists(path.join(path.dirname(__file__), 'pykakasi', 'src', '__init__.py')):
@@ -405,23 +422,67 @@ class MainDialog(MainDialogUI):
 
         self.note_fields.hide()
 
-    def update_notes_list(self):
+    def extended_filters(self) -> list:
+        return [self.category[1].currentText(), self.sort[1].currentText(),
+                [self.min_length[1].value(), self.max_length[1].value()], self.jlpt_level[1].currentText(),
+                self.wanikani_level[1].currentText(), self.exact.isChecked()]
+
+    def _on_search_text_edited(self, _text: str):
+        if config['search_as_you_type']:
+            # restarts the countdown, so only a pause in typing searches
+            self._search_debounce.start()
+
+    def update_notes_list(self, incremental: bool = False):
         self.search_term_edit.setFocus()
-        self.search_result_label.hide()
-        if not self.search_term_edit.text():
+        if not incremental:
+            self._search_debounce.stop()
+        term = self.search_term_edit.text()
+        if not term.strip():
+            self.search_result_label.hide()
             return
 
-        # measure against double search
+        # one search at a time. the newest one waits and supersedes whatever finishes before it
         if self.search_block:
+            self._queued_search = incremental if self._queued_search is None else (self._queued_search and incremental)
             return
         self.search_block = True
+        self._search_generation += 1
+        generation = self._search_generation
+        filters = self.extended_filters()
 
         self.search_result_label.set_count(custom_text="Loading...")
 
+        def is_current() -> bool:
+            return generation == self._search_generation and self._queued_search is None
+
+        def show_partial_notes(notes: note_getter.PagedNotes):
+            if is_current() and self.search_block:
+                self.show_notes(notes)
+                self.search_result_label.set_count(custom_text="Loading...")
+
+        def search(_col):
+            if incremental and (notes := note_getter.cached_prefix_notes(note_getter.SEARCH_URL, term, extended_filters=filters)):
+                mw.taskman.run_on_main(lambda: show_partial_notes(notes))
+            return note_getter.fetch_notes(
+                note_getter.SEARCH_URL, term, extended_filters=filters,
+                on_first_page=lambda first_page: mw.taskman.run_on_main(lambda: show_partial_notes(first_page))
+            )
+
         def on_load_finished(notes: list[dict]):
+            self.search_block = False
+            if (queued := self._queued_search) is not None:
+                # typed on while this search ran, its results are stale already
+                self._queued_search = None
+                logDebug(f'Dropped the results for "{term}", a newer search is waiting')
+                return self.update_notes_list(incremental=queued)
+            if not is_current():
+                return
+
             if isinstance(notes, Exception):
                 self.search_result_label.set_count(custom_text="Connection failed.")
-                self.search_block = False
+                if incremental:
+                    # no message box for every keystroke, the search button shows the details
+                    return
                 # Build a more helpful message depending on error type
                 if isinstance(notes, urlerror.HTTPError):
                     msg = f"Immersion Kit API error {notes.code}: {getattr(notes, 'reason', '') or 'HTTP error'}."
@@ -432,31 +493,43 @@ class MainDialog(MainDialogUI):
                 msg += "\nTry unsetting min./max. length, check connection, or try again later."
                 return showInfo(msg)
 
-            limited_notes = notes[:config['notes_per_page']]
+            self.show_notes(notes)
 
-            self.note_list.set_notes(
-                limited_notes,
-                hide_fields=config['hidden_fields'],
-                previewer=config['preview_on_right_side']
-            )
+        op = QueryOp(parent=self, op=search, success=on_load_finished)
+        if incremental:
+            # no modal progress window, it would take the focus from the search bar
+            op.run_in_background()
+        else:
+            op.with_progress("Searching for cards...").run_in_background()
+
+    def open_batch_search(self):
+        from .batch_search import BatchSearchDialog
+        dialog = BatchSearchDialog(
+            self,
+            model_id=self.note_type_selection_combo.currentData(),
+            deck_id=self.current_profile_deck_combo.currentData(),
+            filters=self.extended_filters(),
+        )
+        dialog.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        dialog.show()
 
-            self.search_result_label.set_count(len(notes), config['notes_per_page'], len(limited_notes))
-            self.page_prev.setEnabled(False)
-            if len(notes) > config['notes_per_page']:
-                self.page_skip.setEnabled(True)
-            self.page = 1
+    def show_notes(self, notes: Sequence[dict]):
+        """Shows the first page of a search's notes."""
+        note_getter.cur_note_list = notes
+        limited_notes = notes[:config['notes_per_page']]
 
-            self.search_block = False
+        self.note_list.set_notes(
+            limited_notes,
+            hide_fields=config['hidden_fields'],
+            previewer=config['preview_on_right_side'],
+            badge=self.note_badge
+        )
 
-        QueryOp(
-            parent=self,
-            op=lambda c: note_getter.get_for("https://apiv2.immersionkit.com/search", self.search_term_edit.text(),
-                                             extended_filters=[self.category[1].currentText(), self.sort[1].currentText(),
-                                             [self.min_length[1].value(), self.max_length[1].value(
-                                             )], self.jlpt_level[1].currentText(),
-                self.wanikani_level[1].currentText(), self.exact.isChecked()]),
-            success=on_load_finished,
-        ).with_progress("Searching for cards...").run_in_background()
+        self.search_result_label.set_count(len(notes), config['notes_per_page'], len(limited_notes))
+        self.page_prev.setEnabled(False)
+        self.page_skip.setEnabled(len(notes) > config['notes_per_page'])
+        self.page = 1
+        self.prefetch_next_page()
 
     def change_page(self, is_skip_page=True):
         # if the current page is 2 and npp 100, x:y = 100:200. If setting the npp to 50, x:y changes to 50:100.
@@ -496,7 +569,8 @@ class MainDialog(MainDialogUI):
         self.note_list.set_notes(
             limited_notes,
             hide_fields=config['hidden_fields'],
-            previewer=config['preview_on_right_side']
+            previewer=config['preview_on_right_side'],
+            badge=self.note_badge
         )
         self.search_result_label.set_count(
             cur_notes_len, config['notes_per_page'], len(limited_notes), self.page)
@@ -505,26 +579,36 @@ class MainDialog(MainDialogUI):
         self.page_skip.setEnabled(cur_notes_len-1 > page_end) # note: aims for the next page's start
         
         self.note_list.clear_selection()  # try to clear, seems not to work though
-  
+        self.prefetch_next_page()
+
+    def note_badge(self, note: dict) -> str:
+        """Marks results that are already owned."""
+        if id_index.nid_for(note['ID']) is not None:
+            return 'already imported'
+        # the rows are drawn again once the notes of the note type were read in the background
+        if is_in_collection(self.note_type_selection_combo.currentData(), note, on_loaded=self.note_list.refresh_badges):
+            return 'already in collection'
+        return ''
+
+    def prefetch_next_page(self):
+        """Builds the notes of the page after the current one in the background."""
+        notes = note_getter.cur_note_list
+        start = self.page * config['notes_per_page']
+        if isinstance(notes, note_getter.PagedNotes) and start < len(notes):
+            mw.taskman.run_in_background(lambda: notes.materialize(start, start + config['notes_per_page']))
 
     def start_import(self):
-        def _execute_import(self):
+        def _execute_import(self, notes: list[dict]) -> list[ImportResult]:
             logDebug('Beginning Import')
-
-            # Get selected notes
-            notes = self.note_list.selected_notes()
             logDebug(f'Importing {len(notes)} notes')
 
-            results = []
-            for note in notes:
-                result = import_note(
-                    model_id=self.note_type_selection_combo.currentData(),
-                    note=note,
-                    deck_id=self.current_profile_deck_combo.currentData()
-                )
-                results.append(result)
+            return import_notes(
+                model_id=self.note_type_selection_combo.currentData(),
+                notes=notes,
+                deck_id=self.current_profile_deck_combo.currentData()
+            )
 
-        def _finish_import(self):
+        def _finish_import(self, results: list[ImportResult]):
             # Clear the selection here to be able to run in background
             self.note_list.clear_selection()
             self.status_bar.set_status(successes=results.count(ImportResult.success),
@@ -533,15 +617,13 @@ class MainDialog(MainDialogUI):
             mw.reset()
 
 
-        if len(self.note_list.selected_notes()) < 1:
+        if len(notes := self.note_list.selected_notes()) < 1:
             return self.status_bar.set_status(custom_text="No notes selected.")
 
-        results = []
-
         QueryOp(
             parent=self,
-            op=lambda c: _execute_import(self),
-            success=lambda c: QTimer.singleShot(0, lambda: _finish_import(self)),
+            op=lambda c: _execute_import(self, notes),
+            success=lambda results: QTimer.singleShot(0, lambda: _finish_import(self, results)),
         ).with_progress("Importing...").run_in_background()
         
 
@@ -555,52 +637,3 @@ class MainDialog(MainDialogUI):
     def done(self, result_code: int):
         self.window_state.save()
         return super().done(result_code)
-
-######################################################################
-# Entry point
-######################################################################
-
-
-def init():
-    # init dialog
-    d = mw._ani_main_dialog = MainDialog(parent=mw)
-    # get AJT menu
-    root_menu = menu_root_entry()
-    # create a new menu item
-    action = QAction('Search for Sub2Srs Cards...', root_menu)
-    # set it to call show function when it's clicked
-    qconnect(action.triggered, d.show)
-
-    def on_finish(result):
-        if result:
-            showInfo(f"Successfully updated {0 if result == True else len(list(result))} notes. Jlab now works for them.")
-        else:
-            show_critical(
-                "Not able to update. Please check if Kakasi is installed by opening the SubSearch window.")
-    # and add it to the tools menu
-    root_menu.addActions([action])
-    # react to anki's state changes
-    gui_hooks.profile_will_close.append(d.close)
-
-    # check for not 1.2 converted cards
-    def check_12(col):
-        for model in col.models.all_names_and_ids():
-            if model.name.startswith('SubCard-JlabConverted'):
-                models_notes = col.models.nids(model.id)
-                if len(models_notes) > 0:
-                    example_note = col.get_note(models_notes[0])
-                    if not example_note['Jlab-ListeningFront'].strip():
-                        return 1
-    gui_hooks.main_window_did_init.append(lambda: QueryOp(parent=mw, op=check_12, success=lambda r: 
-        ask_user("Sub2Srs Search:\n\nPlease update your cards for Jlab Compatibility.\nThis is required for Jlab to work and will need kakasi added to SubSearch.\n\nIf you want to do this afterwards, you have gotten a new option 'Update Jlab cards...' in the menu.",
-                lambda yes: QueryOp(parent=mw,
-                op=note_getter.update_jlab_cards,
-                success=on_finish).with_progress("Updating Jlab formatting...").run_in_background() if yes else 0) if r else 0).run_in_background())
-
-    # check for kakasi
-    if config["jlab_format"] and not path.exists(path.join(path.dirname(__file__), 'pykakasi', 'src', '__init__.py')):
-        logDebug("Pykakasi not found, asking for add...")
-        gui_hooks.main_window_did_init.append(lambda: ask_user("Sub2Srs Search:\n\nFor Jlab Format required pykakasi not found. Do you want to download it now?",
-                                                               lambda yes: add_kakasi(note_getter.import_kakasi) if yes else 0))
-    elif config["jlab_format"]:
-        note_getter.import_kakasi(1)
@@ -9,7 +9,7 @@ from aqt import mw
 from aqt.qt import *
 from aqt.utils import restoreGeom, saveGeom, disable_help_button, showInfo, ask_user
 
-from .subsearch_ajt.about_menu import tweak_window, menu_root_entry
+from .subsearch_ajt.about_menu import tweak_window
 from .common import ADDON_NAME, add_kakasi, LogDebug
 from .config import config
 from .widgets import ItemBox, SpinBox
@@ -97,13 +97,3 @@ class SubSearchSettingsDialog(QDialog):
             config[key] = checkbox.isChecked()
         config.write_config()
         return super().accept()
-
-
-def init():
-    def on_open_settings():
-        dialog = SubSearchSettingsDialog(parent=mw)
-        dialog.exec()
-
-    root_menu = menu_root_entry()
-    action = root_menu.addAction(f"{ADDON_NAME}'s Settings...")
-    qconnect(action.triggered, on_open_settings)
@@ -0,0 +1,77 @@
+# Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
+
+"""
+Pytest plugin (see pytest.ini) that lets the add-on's modules that don't need a running Anki be imported without it.
+aqt and anki are replaced by small stand-ins, and the add-on folder is registered as the package
+"subsearch" without running its __init__, which would set up the menus.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import types
+from pathlib import Path
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _Hooks:
+    """Every hook is a plain list of callbacks."""
+
+    def __getattr__(self, name: str) -> list:
+        hook = []
+        setattr(self, name, hook)
+        return hook
+
+
+class _AddonManager:
+    def addonFromModule(self, module: str) -> str:
+        return module.split('.')[0]
+
+    def addonConfigDefaults(self, addon: str) -> dict:
+        with open(os.path.join(ROOT, 'config.json'), encoding='utf-8') as f:
+            return json.load(f)
+
+    def getConfig(self, module: str) -> dict:
+        return {'enable_debug_log': False}
+
+    def writeConfig(self, module: str, config: dict) -> None:
+        pass
+
+    def setConfigAction(self, module: str, fn) -> None:
+        pass
+
+
+def _module(name: str, **attrs) -> types.ModuleType:
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+
+def _install_stubs() -> None:
+    mw = types.SimpleNamespace(
+        addonManager=_AddonManager(),
+        pm=types.SimpleNamespace(base=tempfile.gettempdir(), name='test'),
+    )
+    aqt = _module('aqt', mw=mw, gui_hooks=_Hooks())
+    aqt.utils = _module('aqt.utils', tooltip=print, showCritical=print, showInfo=print, show_info=print)
+    aqt.operations = _module('aqt.operations', QueryOp=object)
+    anki = _module('anki')
+    anki.collection = _module('anki.collection', Collection=object)
+
+    package = _module('subsearch', __path__=[ROOT])
+    package.__file__ = os.path.join(ROOT, '__init__.py')
+
+
+_install_stubs()
+
+
+def pytest_collect_directory(path: Path, parent):
+    # collected as a package, the add-on folder's __init__ would be imported
+    if path == Path(ROOT):
+        return pytest.Dir.from_parent(parent, path=path)
@@ -0,0 +1,165 @@
+# Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import URLError
+
+import pytest
+
+from subsearch.http_client import CircuitBreaker, CircuitOpenError, HttpClient, TokenBucket
+
+REQUESTS = 50
+
+
+class CountingServer(ThreadingHTTPServer):
+    """Stand-in for the Immersion Kit api that counts the connections it accepts."""
+    daemon_threads = True
+
+    def __init__(self, handler):
+        super().__init__(('127.0.0.1', 0), handler)
+        self.accepted = 0
+        self.hits: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    def get_request(self):
+        request = super().get_request()
+        with self.lock:
+            self.accepted += 1
+        return request
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """
+    /throttled answers 429 once and asks to retry after a second,
+    /broken answers 503 with a body that breaks off, everything else succeeds.
+    """
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, don't let them wait for the client's delayed ack
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.hits[self.path] = hits = self.server.hits.get(self.path, 0) + 1
+        if self.path == '/throttled' and hits == 1:
+            return self._respond(429, b'slow down', {'Retry-After': '1'})
+        if self.path == '/broken':
+            self.send_response(503)
+            self.send_header('Content-Length', '1000')
+            self.end_headers()
+            self.wfile.write(b'unavailable')
+            self.close_connection = True
+            return
+        self._respond(200, b'{"data": []}')
+
+    def _respond(self, status: int, body: bytes, headers: dict = None):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = CountingServer(KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(pool_size: int = 4, **kwargs) -> HttpClient:
+    return HttpClient(connect_timeout=5, read_timeout=5, pool_size=pool_size, **kwargs)
+
+
+def test_sequential_requests_share_one_connection(server):
+    client = make_client()
+    for i in range(REQUESTS):
+        assert client.get(f'{server.url}/search?keyword={i}') == b'{"data": []}'
+    client.close()
+    assert server.accepted == 1
+
+
+def test_parallel_requests_open_at_most_pool_size_connections(server):
+    client = make_client(pool_size=4)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        bodies = list(executor.map(lambda i: client.get(f'{server.url}/search?keyword={i}'), range(REQUESTS)))
+    client.close()
+    assert bodies == [b'{"data": []}'] * REQUESTS
+    assert server.accepted <= 4
+
+
+def test_throttled_request_is_retried_after_retry_after(server):
+    client = make_client(retries=2)
+    start = time.monotonic()
+    assert client.get(f'{server.url}/throttled') == b'{"data": []}'
+    elapsed = time.monotonic() - start
+    client.close()
+    assert server.hits['/throttled'] == 2
+    assert 0.9 <= elapsed < 5
+
+
+def test_token_bucket_spaces_requests_after_the_burst():
+    bucket = TokenBucket(20, burst=5)
+    start = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - start < 0.05
+    for _ in range(10):
+        bucket.acquire()
+    # ten more requests at 20 per second
+    assert 0.45 <= time.monotonic() - start < 1
+
+
+def test_circuit_breaker_opens_and_recovers_after_cooldown():
+    breaker = CircuitBreaker('example.com', threshold=2, cooldown=0.2)
+    breaker.record_failure()
+    breaker.check()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    time.sleep(0.25)
+    # one trial request is let through, others wait for its outcome
+    breaker.check()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    breaker.record_success()
+    breaker.check()
+    breaker.check()
+
+
+def test_circuit_breaker_reopens_when_the_trial_fails():
+    breaker = CircuitBreaker('example.com', threshold=1, cooldown=0.2)
+    breaker.record_failure()
+    time.sleep(0.25)
+    breaker.check()
+    breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_broken_error_body_doesnt_keep_the_circuit_open(server):
+    client = make_client(failure_threshold=1, cooldown=0.2)
+    for _ in range(2):
+        with pytest.raises(URLError) as err:
+            client.get(f'{server.url}/broken')
+        assert not isinstance(err.value, CircuitOpenError)
+        with pytest.raises(CircuitOpenError):
+            client.get(f'{server.url}/ok')
+        time.sleep(0.25)
+    assert client.get(f'{server.url}/ok') == b'{"data": []}'
+    client.close()
+    assert server.hits['/broken'] == 2
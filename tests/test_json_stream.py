@@ -0,0 +1,133 @@
+# Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
+
+import json
+import random
+
+import pytest
+
+from subsearch.json_stream import ObjectStreamParser
+
+CASES = 2000
+MUTATION_CHARS = ' ,:[]{}"x1-.e\\'
+
+
+def parse(text: str, rng: random.Random) -> dict:
+    """Feeds text to a parser in chunks of random size, which may split utf-8 sequences, and returns the result."""
+    data = text.encode('utf-8')
+    parser = ObjectStreamParser('examples')
+    streamed = []
+    pos = 0
+    while pos < len(data):
+        size = rng.randint(1, 8)
+        streamed.extend(parser.feed(data[pos:pos + size]))
+        pos += size
+    streamed.extend(parser.feed(b'', final=True))
+    assert streamed == parser.items
+    return parser.result
+
+
+def random_value(rng: random.Random, depth: int = 0):
+    kinds = ['int', 'float', 'str', 'bool', 'null'] + (['list', 'dict'] if depth < 3 else [])
+    kind = rng.choice(kinds)
+    if kind == 'int':
+        return rng.randint(-10 ** 6, 10 ** 6)
+    if kind == 'float':
+        return rng.uniform(-1e3, 1e3) * 10 ** rng.randint(-5, 5)
+    if kind == 'str':
+        return ''.join(rng.choice('aé字"\\/\n ') for _ in range(rng.randint(0, 6)))
+    if kind == 'bool':
+        return rng.random() < 0.5
+    if kind == 'null':
+        return None
+    if kind == 'list':
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 3))]
+    return {f'k{i}': random_value(rng, depth + 1) for i in range(rng.randint(0, 3))}
+
+
+def random_document(rng: random.Random) -> str:
+    doc = {f'key{i}': random_value(rng) for i in range(rng.randint(0, 3))}
+    if rng.random() < 0.8:
+        doc['examples'] = [random_value(rng) for _ in range(rng.randint(0, 5))]
+    separators = rng.choice([(',', ':'), (', ', ': '), (' ,\n', ' :\t')])
+    return json.dumps(doc, ensure_ascii=rng.random() < 0.5, separators=separators)
+
+
+def mutate(text: str, rng: random.Random) -> str:
+    pos = rng.randint(0, len(text))
+    action = rng.choice(['insert', 'delete', 'truncate', 'append'])
+    if action == 'insert':
+        return text[:pos] + rng.choice(MUTATION_CHARS) + text[pos:]
+    if action == 'delete':
+        return text[:pos] + text[pos + 1:]
+    if action == 'truncate':
+        return text[:pos]
+    return text + rng.choice([' ', ' x', ',', '}', '{}', '\n1'])
+
+
+def assert_same_as_json_loads(text: str, rng: random.Random):
+    try:
+        expected = json.loads(text)
+    except ValueError:
+        with pytest.raises(ValueError):
+            parse(text, rng)
+        return
+    if isinstance(expected, dict):
+        assert parse(text, rng) == expected
+    else:
+        with pytest.raises(ValueError):
+            parse(text, rng)
+
+
+@pytest.mark.parametrize('text', [
+    '{}',
+    ' {"examples": []} ',
+    '{"a": 1, "examples": [1, "2", [3], {"4": 5}], "b": {"c": [true, false, null]}}',
+    '{"examples": [-2.5e3, 0.1, "字"]}',
+])
+def test_valid(text):
+    assert parse(text, random.Random(0)) == json.loads(text)
+
+
+@pytest.mark.parametrize('text', [
+    '{"a":1,}',
+    '{,}',
+    '{"examples":[1,]}',
+    '{"examples":[,1]}',
+    '{"a":[1,]}',
+    '{"a":1} x',
+    '{"a":1}}',
+    '{"a":1}{}',
+    '{1:2}',
+    '{"a" 1}',
+    '{"a":1',
+    '',
+])
+def test_invalid(text):
+    with pytest.raises(ValueError):
+        json.loads(text)
+    with pytest.raises(ValueError):
+        parse(text, random.Random(0))
+
+
+@pytest.mark.parametrize('text', ['[]', '1', '"examples"', 'null'])
+def test_not_an_object(text):
+    with pytest.raises(ValueError):
+        parse(text, random.Random(0))
+
+
+def test_extra_data_in_later_chunk():
+    parser = ObjectStreamParser('examples')
+    parser.feed(b'{"examples": [1]}  ')
+    with pytest.raises(ValueError):
+        parser.feed(b' x')
+
+
+def test_fuzz_against_json_loads():
+    rng = random.Random(1234)
+    for _ in range(CASES):
+        text = random_document(rng)
+        assert_same_as_json_loads(text, rng)
+        for _ in range(rng.randint(1, 2)):
+            text = mutate(text, rng)
+        assert_same_as_json_loads(text, rng)
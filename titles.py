@@ -0,0 +1,109 @@
+# Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
+# License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
+
+import json
+import os
+import threading
+from typing import Optional
+
+from .common import LogDebug
+
+logDebug = LogDebug()
+
+TITLES_PATH = os.path.join(os.path.dirname(__file__), "data", "titles.json")
+CATEGORIES_PATH = os.path.join(os.path.dirname(__file__), "user_files", "title_categories.json")
+
+
+class TitleIndex:
+    """
+    In-memory slug -> title mapping of data/titles.json.
+    The file is read once and only read again if its mtime changes.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._mtime: Optional[float] = None
+        self._titles: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _reload_if_changed(self) -> None:
+        try:
+            mtime = os.stat(self._path).st_mtime
+        except OSError as err:
+            logDebug(f"Unable to stat {self._path}: {err}")
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            if mtime == self._mtime:
+                return
+            with open(self._path, "r", encoding="utf-8") as f:
+                self._titles = json.load(f)
+            self._mtime = mtime
+            logDebug(f"Loaded {len(self._titles)} titles from {self._path}")
+
+    def lookup(self, slug: str) -> Optional[str]:
+        """Returns the real title for an Immersion Kit slug or None if it is unknown."""
+        self._reload_if_changed()
+        return self._titles.get(slug)
+
+    def __contains__(self, slug: str) -> bool:
+        return self.lookup(slug) is not None
+
+
+class CategoryIndex:
+    """
+    Title -> category mapping, inverted from the 'deck_count' of search responses.
+    Titles seen in earlier responses are kept in user_files, so they resolve
+    even if a later response doesn't list them.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self._categories: Optional[dict[str, str]] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict[str, str]:
+        if self._categories is None:
+            try:
+                with open(self._path, "r", encoding="utf-8") as f:
+                    self._categories = json.load(f)
+            except (OSError, ValueError):
+                self._categories = {}
+        return self._categories
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        with open(self._path, "w", encoding="utf-8") as f:
+            json.dump(self._categories, f, ensure_ascii=False)
+
+    def update(self, deck_count: dict[str, dict]) -> dict[str, str]:
+        """Inverts deck_count of one response, merges it into the index and returns the inverted dict."""
+        response_categories: dict[str, str] = {}
+        for category, details in deck_count.items():
+            for title in details:
+                # the first category listing a title wins, as before the index existed
+                response_categories.setdefault(title, category)
+        with self._lock:
+            categories = self._load()
+            changed = {title: category for title, category in response_categories.items() if categories.get(title) != category}
+            if changed:
+                categories.update(changed)
+                try:
+                    self._save()
+                except OSError as err:
+                    logDebug(f"Unable to save category index: {err}")
+                logDebug(f"Added {len(changed)} titles to the category index")
+        return response_categories
+
+    def lookup(self, title: str) -> Optional[str]:
+        with self._lock:
+            return self._load().get(title)
+
+
+title_index = TitleIndex(TITLES_PATH)
+category_index = CategoryIndex(CATEGORIES_PATH)
+
+
+def lookup(slug: str) -> Optional[str]:
+    return title_index.lookup(slug)
@@ -1,12 +1,18 @@
 # Copyright: Ren Tatsumoto <tatsu at autistici.org> and FileX <filex.stuff@proton.me>
 # License: GNU AGPL, version 3 or later; http://www.gnu.org/licenses/agpl.html
 
-from collections.abc import Iterable, Sequence
+import functools
+import re
+from collections.abc import Callable, Iterable, Sequence
 from math import ceil
+from typing import Optional
 
 from aqt.qt import *
 
 from .common import NameId
+from .config import config
+from .media_cache import cache as media_cache
+from .note_getter import LazyNote
 from .note_previewer import NotePreviewer
 
 WIDGET_HEIGHT = 29
@@ -183,18 +189,103 @@ class ItemBox(QWidget):
             edit.setText('')
 
 
+class HiddenFieldMatcher:
+    """
+    Tells whether a field is hidden from the note list, i.e. its name contains one of the
+    hidden_fields keywords, regardless of case. Results are remembered per field name.
+    """
+
+    def __init__(self, hidden_fields: Iterable[str]):
+        keywords = [re.escape(keyword) for keyword in hidden_fields]
+        self._pattern = re.compile('|'.join(keywords), re.IGNORECASE) if keywords else None
+        self._hidden: dict[str, bool] = {'needed_media': True}
+
+    def __call__(self, field_name: str) -> bool:
+        if (hidden := self._hidden.get(field_name)) is None:
+            hidden = self._hidden[field_name] = bool(self._pattern and self._pattern.search(field_name))
+        return hidden
+
+
+@functools.lru_cache(maxsize=8)
+def hidden_field_matcher(hidden_fields: tuple[str, ...]) -> HiddenFieldMatcher:
+    return HiddenFieldMatcher(hidden_fields)
+
+
+class NoteListModel(QAbstractListModel):
+    """Rows of NoteList. A row's text is only built once the view displays it."""
+
+    def __init__(self, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self._notes: list[dict] = []
+        self._rows: dict[int, tuple[str, str]] = {}
+        self._is_hidden = hidden_field_matcher(())
+        self._badge: Optional[Callable[[dict], str]] = None
+
+    def set_notes(self, notes: Iterable[dict], hide_fields: list[str], badge: Optional[Callable[[dict], str]] = None):
+        notes = list(notes)
+        is_hidden = hidden_field_matcher(tuple(hide_fields))
+        if (is_hidden is self._is_hidden and badge == self._badge and len(notes) == len(self._notes)
+                and all(new is old for new, old in zip(notes, self._notes))):
+            # e.g. the complete results of a search whose first page is already shown. keeps the selection
+            return
+        self.beginResetModel()
+        # keep the notes themselves out of Qt, which would convert every dict into a QVariantMap
+        self._notes = notes
+        self._rows = {}
+        self._is_hidden = is_hidden
+        self._badge = badge
+        self.endResetModel()
+
+    def refresh_badges(self):
+        """Rebuilds the rows' texts, e.g. once notes were imported and their badges changed."""
+        if not self._notes:
+            return
+        self._rows = {}
+        self.dataChanged.emit(self.index(0), self.index(len(self._notes) - 1))
+
+    def note(self, row: int) -> dict:
+        return self._notes[row]
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._notes)
+
+    def _row(self, row: int) -> tuple[str, str]:
+        """Returns the text and badge of a row."""
+        if row not in self._rows:
+            note = self._notes[row]
+            # lazy Jlab fields are left out, so listing a note doesn't run kakasi for it
+            items = note.eager_items() if isinstance(note, LazyNote) else note.items()
+            is_hidden = self._is_hidden
+            text = ' | '.join(field_content
+                for field_name, field_content in items
+                if not is_hidden(field_name) and field_content.strip()
+            )
+            badge_text = self._badge(note) if self._badge else ''
+            self._rows[row] = (f'({badge_text}) {text}' if badge_text else text), badge_text
+        return self._rows[row]
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            return self._row(index.row())[0]
+        if role == Qt.ItemDataRole.ForegroundRole and self._row(index.row())[1]:
+            return QColor('gray')
+        return None
+
+
 class NoteList(QWidget):
     """Lists notes and previews them."""
-    _role = Qt.ItemDataRole.UserRole
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self._note_list = QListWidget(self)
+        self._note_list = QListView(self)
+        self._model = NoteListModel(self)
+        self._note_list.setModel(self._model)
         self._previewer = NotePreviewer(self)
         self._enable_previewer = True
         self._setup_ui()
-        self.itemDoubleClicked = self._note_list.itemDoubleClicked
-        qconnect(self._note_list.currentItemChanged, self._on_current_item_changed)
+        qconnect(self._note_list.selectionModel().currentChanged, self._on_current_item_changed)
 
     def _setup_ui(self):
         self.setLayout(layout := QHBoxLayout())
@@ -209,41 +300,39 @@ class NoteList(QWidget):
 
         self._note_list.setAlternatingRowColors(True)
         self._note_list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        # all rows are single lines, so the view doesn't have to measure each of them
+        self._note_list.setUniformItemSizes(True)
         self._note_list.setContentsMargins(0, 0, 0, 0)
 
         self._previewer.setHidden(True)
 
-    def _on_current_item_changed(self, current: QListWidgetItem, _previous: QListWidgetItem):
-        if current is None or self._enable_previewer is False:
+    def _on_current_item_changed(self, current: QModelIndex, _previous: QModelIndex):
+        if not current.isValid() or self._enable_previewer is False:
             self._previewer.setHidden(True)
         else:
             self._previewer.setHidden(False)
-            self._previewer.load_note(current.data(self._role))
+            self._prefetch_media(current.row())
+            self._previewer.load_note(self._model.note(current.row()))
+
+    def _prefetch_media(self, row: int):
+        """Caches the media of the row and the next few ones in the background."""
+        end = min(row + 1 + config['media_prefetch_count'], self._model.rowCount())
+        media_cache.prefetch(url for r in range(row, end) for url in self._model.note(r)['needed_media'])
 
     def selected_notes(self) -> Sequence[dict]:
-        return [item.data(self._role) for item in self._note_list.selectedItems()]
+        return [self._model.note(index.row()) for index in self._note_list.selectionModel().selectedIndexes()]
 
     def clear_selection(self):
         self._previewer.setHidden(True)
         return self._note_list.clearSelection()
 
     def clear(self):
-        self._note_list.clear()
+        self._model.set_notes([], hide_fields=[])
 
-    def set_notes(self, notes: list, hide_fields: list[str], previewer: bool = True):
-        self._enable_previewer = previewer
+    def refresh_badges(self):
+        self._model.refresh_badges()
 
-        def is_hidden(field_name: str) -> bool:
-            field_name = field_name.lower()
-            return any(hidden_field.lower() in field_name for hidden_field in hide_fields)
-
-        self.clear()
-        for note in notes:
-            item = QListWidgetItem()
-            
-            item.setText(' | '.join(field_content
-                for field_name, field_content in note.items()
-                if not (is_hidden(field_name) or field_name == 'needed_media') and field_content.strip()
-            ))
-            item.setData(self._role, note)
-            self._note_list.addItem(item)
+    def set_notes(self, notes: list, hide_fields: list[str], previewer: bool = True,
+                  badge: Optional[Callable[[dict], str]] = None):
+        self._enable_previewer = previewer
+        self._model.set_notes(notes, hide_fields=hide_fields, badge=badge)